@@ -4,12 +4,16 @@
 """
 import argparse
 import asyncio
+import aiofiles
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from src.config import config
+from src.config import config, ensure_output_dirs
 from src.analyzers import MetadataExtractor, ASTParser
 from src.fuzzer import FuzzEngine
-from src.agents import GenerationAgent
+from src.agents import GenerationAgent, close_http_client
+from src.core import cleanup, response_cache
+from src.models.code_metadata import CodeMetadata
 
 def run_server():
     """启动Web服务"""
@@ -18,12 +22,26 @@ def run_server():
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.staticfiles import StaticFiles
     from fastapi.responses import FileResponse
-    from src.api import router
+    from src.api import router, close_temp_pool, ORJSONResponse
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # 恢复上次运行保存的分析结果缓存
+        response_cache.load()
+        yield
+        response_cache.save()
+        # 等待后台清理任务删除剩余的临时目录
+        await cleanup.drain()
+        close_temp_pool()
+        # 关闭共享的LLM HTTP连接池
+        await close_http_client()
     
     app = FastAPI(
         title="智能代码分析系统",
         description="基于LLM智能体的代码分析与模糊测试驱动生成",
-        version="0.1.0"
+        version="0.1.0",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse
     )
     
     app.add_middleware(
@@ -44,7 +62,15 @@ def run_server():
     print(f"启动服务: http://{config.host}:{config.port}")
     print(f"API文档: http://{config.host}:{config.port}/docs")
     
-    uvicorn.run(app, host=config.host, port=config.port)
+    uvicorn.run(
+        app,
+        host=config.host,
+        port=config.port,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        proxy_headers=False
+    )
 
 async def analyze_project(project_path: str, max_iterations: int = 100):
     """分析项目"""
@@ -123,8 +149,6 @@ async def generate_harness(file_path: str):
         print("未找到可测试的函数")
         return
     
-    from src.models.code_metadata import CodeMetadata
-    
     metadata = CodeMetadata(
         project_name=path.stem,
         language="cpp" if path.suffix in [".cpp", ".hpp", ".cc"] else "c",
@@ -142,11 +166,19 @@ async def generate_harness(file_path: str):
     print("-" * 50)
     
     # 保存到文件
+    ensure_output_dirs()
     output_file = config.harness_dir / f"harness_{path.stem}.c"
-    with open(output_file, 'w') as f:
-        f.write(harness.harness_code)
+    async with aiofiles.open(output_file, 'w', encoding='utf-8') as f:
+        await f.write(harness.harness_code)
     print(f"\n已保存到: {output_file}")
 
+async def run_cli(coro):
+    """运行CLI命令，结束后关闭共享的HTTP连接池"""
+    try:
+        return await coro
+    finally:
+        await close_http_client()
+
 def main():
     parser = argparse.ArgumentParser(
         description="智能代码分析与模糊测试驱动生成系统"
@@ -178,11 +210,11 @@ def main():
     elif args.command == "analyze":
         path = Path(args.path)
         if path.is_file():
-            asyncio.run(analyze_file(args.path))
+            asyncio.run(run_cli(analyze_file(args.path)))
         else:
-            asyncio.run(analyze_project(args.path, args.iterations))
+            asyncio.run(run_cli(analyze_project(args.path, args.iterations)))
     elif args.command == "generate":
-        asyncio.run(generate_harness(args.file))
+        asyncio.run(run_cli(generate_harness(args.file)))
     else:
         parser.print_help()
 
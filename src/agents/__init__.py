@@ -1,5 +1,5 @@
 """LLM智能体模块"""
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, close_http_client
 from .generation_agent import GenerationAgent
 from .repair_agent import RepairAgent
 from .mutation_agent import MutationAgent
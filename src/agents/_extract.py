@@ -0,0 +1,63 @@
+"""从LLM响应中提取代码块"""
+import functools
+import string
+from typing import Callable
+
+# 代码块语言标识允许的字符，如 c / cpp / c++ / objective-c
+_TAG_CHARS = frozenset(string.ascii_letters + string.digits + "_+#.-")
+
+# 各语言在代码块围栏上常见的标识
+_LANG_TAGS = {
+    "c": ("c", "h"),
+    "cpp": ("cpp", "c++", "cc", "cxx", "hpp"),
+}
+
+def extract_code(response: str) -> str:
+    """提取第一个代码块的内容，没有代码块时返回去除首尾空白的原文
+    
+    每个围栏只用 str.partition 线性扫描一次，不回头重复查找。
+    """
+    rest = response
+    while True:
+        _, fence, rest = rest.partition("```")
+        if not fence:
+            break
+        # 围栏所在行的剩余部分必须是语言标识（可为空），否则是行内的```
+        tag, newline, body = rest.partition("\n")
+        if newline and _TAG_CHARS.issuperset(tag.rstrip(" \t\r")):
+            code, closing, _ = body.partition("```")
+            if closing:
+                return code.strip()
+            break
+    return response.strip()
+
+def language_tags(language: str) -> tuple[str, ...]:
+    """代码块围栏上表示该语言的标识（小写）"""
+    return _LANG_TAGS.get(language, (language.lower(),))
+
+@functools.lru_cache(maxsize=None)
+def extractor_for(language: str) -> Callable[[str], str]:
+    """返回针对指定语言的提取函数，每种语言只构建一次
+    
+    优先提取以该语言标识开头的代码块（跳过前面的shell命令等其他代码块），
+    找不到时退回 extract_code。标识忽略大小写和行尾空白（含CRLF的\\r）。
+    """
+    tags = language_tags(language)
+    
+    def extract(response: str) -> str:
+        rest = response
+        while True:
+            _, fence, rest = rest.partition("```")
+            if not fence:
+                break
+            tag, newline, body = rest.partition("\n")
+            if not newline:
+                break
+            code, closing, rest = body.partition("```")
+            if not closing:
+                break
+            if tag.strip().lower() in tags:
+                return code.strip()
+        return extract_code(response)
+    
+    return extract
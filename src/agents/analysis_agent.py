@@ -1,6 +1,9 @@
 """代码分析智能体 - 检测代码问题并生成修复代码"""
-from typing import Optional
+from typing import Callable, Optional
+from pydantic import ValidationError
 from .base_agent import BaseAgent
+from ._extract import extract_code
+from ..models.analysis_result import FixReport
 
 SYSTEM_PROMPT = """你是一个专业的代码安全分析专家。
 你的任务是分析用户提供的代码，找出其中的安全漏洞、逻辑错误和潜在问题。
@@ -28,19 +31,32 @@ SYSTEM_PROMPT = """你是一个专业的代码安全分析专家。
 如果代码没有明显问题，也要说明代码的优点和可能的改进建议。
 """
 
-FIX_SYSTEM_PROMPT = """你是一个专业的代码修复专家。
-你的任务是根据发现的安全问题，生成修复后的完整代码。
-
-修复原则：
+_FIX_RULES = """修复原则：
 1. 保持原有功能不变
 2. 修复所有发现的安全漏洞
 3. 添加必要的边界检查和错误处理
 4. 添加注释说明修复了什么问题
 5. 代码风格保持一致
+"""
+
+FIX_SYSTEM_PROMPT = """你是一个专业的代码修复专家。
+你的任务是根据发现的安全问题，生成修复后的完整代码。
 
+""" + _FIX_RULES + """
 输出格式：只输出修复后的完整代码，用```包裹。在关键修复处添加注释说明。
 """
 
+# 在分析对话中追加的修复请求，代码已在第一轮发送，无需重复
+FIX_FOLLOWUP_PROMPT = """请根据以上分析结果，生成修复后的完整代码，修复所有发现的问题。
+
+""" + _FIX_RULES + """
+输出格式：JSON对象，包含两个字段：
+- fixed_code: 修复后的完整代码（字符串），在关键修复处添加注释说明
+- fixes: 修复说明列表（字符串数组）
+"""
+
+_LANG_NAMES = {"c": "C", "cpp": "C++", "python": "Python"}
+
 class AnalysisAgent(BaseAgent):
     """代码分析智能体 - 检测安全漏洞和代码问题，并生成修复代码"""
     
@@ -65,6 +81,51 @@ class AnalysisAgent(BaseAgent):
                 "analysis": ""
             }
     
+    async def analyze_and_fix(
+        self,
+        code: str,
+        language: str = "c",
+        fix_if: Optional[Callable[[str], bool]] = None
+    ) -> dict:
+        """在同一对话中先分析代码再生成修复代码，源码只发送一次
+        
+        fix_if 接收分析结果，返回 False 时跳过修复轮次。
+        """
+        messages = [{"role": "user", "content": self._build_prompt(code, language)}]
+        
+        try:
+            analysis = await self.call_llm_conversation(messages, SYSTEM_PROMPT)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "analysis": "",
+                "fixed_code": ""
+            }
+        
+        result = {
+            "success": True,
+            "analysis": analysis,
+            "language": language,
+            "fixed_code": ""
+        }
+        if fix_if is not None and not fix_if(analysis):
+            return result
+        
+        messages += [
+            {"role": "assistant", "content": analysis},
+            {"role": "user", "content": FIX_FOLLOWUP_PROMPT}
+        ]
+        try:
+            response = await self.call_llm_conversation(
+                messages, SYSTEM_PROMPT, response_schema=FixReport
+            )
+            result["fixed_code"] = self._parse_fix_report(response)
+        except Exception as e:
+            result["fix_error"] = str(e)
+        
+        return result
+    
     async def generate_fixed_code(self, code: str, analysis: str, language: str = "c") -> dict:
         """根据分析结果生成修复后的代码"""
         prompt = self._build_fix_prompt(code, analysis, language)
@@ -85,7 +146,7 @@ class AnalysisAgent(BaseAgent):
     
     def _build_prompt(self, code: str, language: str) -> str:
         """构建分析提示词"""
-        lang_name = {"c": "C", "cpp": "C++", "python": "Python"}.get(language, language)
+        lang_name = _LANG_NAMES.get(language, language)
         
         return f"""请分析以下{lang_name}代码，找出其中的安全漏洞、逻辑错误和潜在问题：
 
@@ -107,7 +168,7 @@ class AnalysisAgent(BaseAgent):
     
     def _build_fix_prompt(self, code: str, analysis: str, language: str) -> str:
         """构建修复提示词"""
-        lang_name = {"c": "C", "cpp": "C++", "python": "Python"}.get(language, language)
+        lang_name = _LANG_NAMES.get(language, language)
         
         return f"""以下是原始{lang_name}代码：
 
@@ -121,15 +182,13 @@ class AnalysisAgent(BaseAgent):
 请生成修复后的完整代码，修复上述所有问题。在修复的关键位置添加注释说明修复了什么。
 """
     
+    def _parse_fix_report(self, response: str) -> str:
+        """解析结构化修复结果，模型未按JSON输出时退回代码块提取"""
+        try:
+            return FixReport.model_validate_json(response).fixed_code
+        except ValidationError:
+            return self._extract_code(response)
+    
     def _extract_code(self, response: str) -> str:
         """从响应中提取代码"""
-        if "```" in response:
-            parts = response.split("```")
-            for i, part in enumerate(parts):
-                if i % 2 == 1:  # 代码块内容
-                    # 去掉语言标识
-                    lines = part.split('\n')
-                    if lines[0].strip() in ['c', 'cpp', 'python', 'C', 'C++', 'Python', '']:
-                        return '\n'.join(lines[1:]).strip()
-                    return part.strip()
-        return response.strip()
+        return extract_code(response)
@@ -1,93 +1,389 @@
 """智能体基类"""
-from abc import ABC, abstractmethod
-from typing import Optional
+import asyncio
+import functools
+import hashlib
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Union
 import httpx
+import orjson
+from pydantic import BaseModel
 from ..config import config
+from ..core.llm_cache import llm_cache
 
-class BaseAgent(ABC):
+DEFAULT_SYSTEM_PROMPT = "You are a helpful coding assistant."
+
+# 提示词可以是纯文本，也可以是Anthropic格式的内容块列表（用于标记可缓存前缀）
+Prompt = Union[str, list[dict]]
+
+# 进程内共享的HTTP客户端，复用TCP/TLS连接
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+# 429限流的重试次数和退避区间（秒）
+_RATE_LIMIT_RETRIES = 3
+_BACKOFF_MIN = 0.5
+_BACKOFF_MAX = 4.0
+
+# 未指定temperature时OpenAI兼容API使用的值；Anthropic不发送，使用服务端默认值
+_OPENAI_DEFAULT_TEMPERATURE = 0.7
+
+
+def _client() -> httpx.AsyncClient:
+    """获取共享的AsyncClient（HTTP/2 + keep-alive），首次使用时创建"""
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        # 自定义transport时连接池参数需设置在transport上；
+        # 传输层重试连接失败，429由_post单独退避重试
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=30
+            )
+        )
+        _CLIENT = httpx.AsyncClient(transport=transport, timeout=120)
+    return _CLIENT
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """计算429后的等待时间：优先使用Retry-After，否则指数退避加随机抖动"""
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), _BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(_BACKOFF_MIN, min(_BACKOFF_MAX, _BACKOFF_MIN * 2 ** (attempt + 1)))
+
+
+async def _post(url: str, headers: dict, body: dict) -> httpx.Response:
+    """发送POST请求，遇到429时退避重试，重试用尽后返回最后一次响应"""
+    # 请求体包含完整源码，用orjson预先序列化一次，重试时复用
+    content = orjson.dumps(body)
+    for attempt in range(_RATE_LIMIT_RETRIES):
+        response = await _client().post(url, headers=headers, content=content)
+        if response.status_code != 429:
+            return response
+        await asyncio.sleep(_retry_delay(response, attempt))
+    return await _client().post(url, headers=headers, content=content)
+
+
+@asynccontextmanager
+async def _stream(url: str, headers: dict, body: dict) -> AsyncIterator[httpx.Response]:
+    """以流式方式发送POST请求，响应头为429时关闭响应并退避重试，与_post的重试次数相同"""
+    content = orjson.dumps(body)
+    for attempt in range(_RATE_LIMIT_RETRIES + 1):
+        client = _client()
+        request = client.build_request("POST", url, headers=headers, content=content)
+        response = await client.send(request, stream=True)
+        if response.status_code != 429 or attempt == _RATE_LIMIT_RETRIES:
+            break
+        await response.aclose()
+        await asyncio.sleep(_retry_delay(response, attempt))
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+
+async def close_http_client():
+    """关闭共享的AsyncClient，在服务关闭或CLI退出时调用"""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def _prompt_cache_key(system_prompt: str) -> str:
+    """系统提示词的稳定指纹，用于OpenAI的prompt_cache_key路由"""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+def prompt_text(prompt: Prompt) -> str:
+    """将内容块列表拼接为纯文本"""
+    if isinstance(prompt, str):
+        return prompt
+    return "".join(block["text"] for block in prompt)
+
+def cached_llm_call(func):
+    """缓存确定性(temperature=0)的LLM调用结果，命中时不再请求API"""
+    @functools.wraps(func)
+    async def wrapper(self, messages: list[dict], system_prompt: Optional[str] = None,
+                      temperature: Optional[float] = None,
+                      response_schema: Optional[type[BaseModel]] = None) -> str:
+        if temperature != 0:
+            return await func(self, messages, system_prompt, temperature, response_schema)
+        
+        cfg = self.llm_config
+        model = cfg.openai_model if cfg.provider == "openai" else cfg.anthropic_model
+        key = llm_cache.make_key(
+            cfg.provider, model, system_prompt or "", str(temperature),
+            response_schema.__name__ if response_schema else "",
+            *(f"{m['role']}:{prompt_text(m['content'])}" for m in messages)
+        )
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        response = await func(self, messages, system_prompt, temperature, response_schema)
+        llm_cache.set(key, response)
+        return response
+    return wrapper
+
+class BaseAgent:
     """智能体基类 - 封装LLM调用"""
     
     def __init__(self, name: str):
         self.name = name
         self.llm_config = config.llm
         self.history: list[dict] = []
+        self._init_request_templates()
+    
+    def _init_request_templates(self):
+        """预先构建请求地址、请求头和请求体骨架，每次调用只需填入消息"""
+        cfg = self.llm_config
+        # 使用配置的base_url，支持DeepSeek等兼容API
+        self._openai_url = cfg.openai_base_url.rstrip('/') + "/chat/completions"
+        self._openai_headers = {
+            "Authorization": f"Bearer {cfg.openai_key}",
+            "Content-Type": "application/json"
+        }
+        self._openai_body = {"model": cfg.openai_model, "max_tokens": 4096}
+        # OpenAI按前缀自动缓存，prompt_cache_key让同一系统提示词的请求命中同一缓存分片；
+        # DeepSeek等兼容API对相同前缀自动缓存，无需额外参数，自建服务可通过配置开启
+        if cfg.prompt_cache == "auto":
+            self._openai_cache_routing = "api.openai.com" in self._openai_url
+        else:
+            self._openai_cache_routing = cfg.prompt_cache == "on"
+        
+        self._anthropic_headers = {
+            "x-api-key": cfg.anthropic_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        }
+        self._anthropic_body = {"model": cfg.anthropic_model, "max_tokens": 4096}
+        # 系统提示词标记为可缓存，重复调用只按缓存价计费
+        self._anthropic_cache_control = (
+            {"cache_control": {"type": "ephemeral"}} if cfg.prompt_cache != "off" else {}
+        )
+    
+    async def call_llm(
+        self,
+        prompt: Prompt,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> str:
+        """调用LLM，temperature为None时使用各服务的默认值，为0时结果会被缓存"""
+        return await self.call_llm_conversation(
+            [{"role": "user", "content": prompt}], system_prompt, temperature
+        )
     
-    async def call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """调用LLM"""
+    @cached_llm_call
+    async def call_llm_conversation(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_schema: Optional[type[BaseModel]] = None
+    ) -> str:
+        """以多轮对话调用LLM，返回最后一轮的回复
+        
+        messages 为 user/assistant 交替的消息列表，后续轮次复用前面的上下文，
+        服务端前缀缓存可直接命中已发送过的内容。
+        指定 response_schema 时要求模型输出JSON，返回符合该模型的JSON字符串。
+        """
         if self.llm_config.provider == "openai":
-            return await self._call_openai(prompt, system_prompt)
+            return await self._call_openai(messages, system_prompt, temperature, response_schema)
         elif self.llm_config.provider == "anthropic":
-            return await self._call_anthropic(prompt, system_prompt)
+            return await self._call_anthropic(messages, system_prompt, temperature, response_schema)
         else:
             raise ValueError(f"Unknown LLM provider: {self.llm_config.provider}")
     
-    async def _call_openai(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """调用OpenAI兼容API (支持OpenAI/DeepSeek/其他兼容API)"""
-        messages = []
+    def stream_llm(
+        self,
+        prompt: Prompt,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """流式调用LLM，逐段产出生成的文本；提前关闭迭代器即中止请求"""
+        messages = [{"role": "user", "content": prompt}]
+        if self.llm_config.provider == "openai":
+            return self._stream_openai(messages, system_prompt, temperature)
+        elif self.llm_config.provider == "anthropic":
+            return self._stream_anthropic(messages, system_prompt, temperature)
+        else:
+            raise ValueError(f"Unknown LLM provider: {self.llm_config.provider}")
+    
+    def _openai_request(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str],
+        temperature: Optional[float]
+    ) -> tuple[str, dict, dict]:
+        """构建OpenAI兼容API的请求地址、请求头和请求体"""
+        # 兼容API不支持cache_control，内容块拼接为纯文本
+        api_messages = [
+            {"role": m["role"], "content": prompt_text(m["content"])} for m in messages
+        ]
         if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
+            api_messages.insert(0, {"role": "system", "content": system_prompt})
         
-        # 使用配置的base_url，支持DeepSeek等兼容API
-        base_url = self.llm_config.openai_base_url.rstrip('/')
+        if temperature is None:
+            temperature = _OPENAI_DEFAULT_TEMPERATURE
+        body = {**self._openai_body, "messages": api_messages, "temperature": temperature}
+        if system_prompt and self._openai_cache_routing:
+            body["prompt_cache_key"] = _prompt_cache_key(system_prompt)
+        return self._openai_url, self._openai_headers, body
+    
+    @staticmethod
+    def _check_openai_status(response: httpx.Response):
+        """将常见的错误状态码转换为可读的异常"""
+        if response.status_code == 402:
+            raise Exception("API账户余额不足，请充值后重试")
+        elif response.status_code == 401:
+            raise Exception("API密钥无效，请检查配置")
+        elif response.status_code == 429:
+            raise Exception("API请求频率过高，请稍后重试")
+        
+        response.raise_for_status()
+    
+    @staticmethod
+    def _openai_error(e: Exception) -> Exception:
+        """统一OpenAI兼容API调用中的异常信息"""
+        if isinstance(e, httpx.HTTPStatusError):
+            return Exception(f"API调用失败: {e.response.status_code} - {e.response.text[:200]}")
+        if isinstance(e, httpx.TimeoutException):
+            return Exception("API请求超时，请稍后重试")
+        if "余额" in str(e) or "密钥" in str(e) or "频率" in str(e):
+            return e
+        return Exception(f"API调用错误: {str(e)}")
+    
+    async def _call_openai(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_schema: Optional[type[BaseModel]] = None
+    ) -> str:
+        """调用OpenAI兼容API (支持OpenAI/DeepSeek/其他兼容API)"""
+        url, headers, body = self._openai_request(messages, system_prompt, temperature)
+        if response_schema is not None:
+            # JSON模式，提示词中需说明输出JSON及字段
+            body["response_format"] = {"type": "json_object"}
         
         try:
-            async with httpx.AsyncClient(timeout=120) as client:
-                response = await client.post(
-                    f"{base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.llm_config.openai_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.llm_config.openai_model,
-                        "messages": messages,
-                        "temperature": 0.7,
-                        "max_tokens": 4096
-                    }
-                )
-                
-                if response.status_code == 402:
-                    raise Exception("API账户余额不足，请充值后重试")
-                elif response.status_code == 401:
-                    raise Exception("API密钥无效，请检查配置")
-                elif response.status_code == 429:
-                    raise Exception("API请求频率过高，请稍后重试")
+            response = await _post(url, headers, body)
+            self._check_openai_status(response)
+            data = orjson.loads(response.content)
+            return data["choices"][0]["message"]["content"]
+        except Exception as e:
+            raise self._openai_error(e)
+    
+    async def _stream_openai(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """以SSE方式调用OpenAI兼容API"""
+        url, headers, body = self._openai_request(messages, system_prompt, temperature)
+        body["stream"] = True
+        
+        try:
+            async with _stream(url, headers, body) as response:
+                if response.is_error:
+                    await response.aread()
+                self._check_openai_status(response)
                 
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
-        except httpx.HTTPStatusError as e:
-            raise Exception(f"API调用失败: {e.response.status_code} - {e.response.text[:200]}")
-        except httpx.TimeoutException:
-            raise Exception("API请求超时，请稍后重试")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[6:]
+                    if data == "[DONE]":
+                        break
+                    choices = orjson.loads(data).get("choices")
+                    if choices:
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            yield delta
         except Exception as e:
-            if "余额" in str(e) or "密钥" in str(e) or "频率" in str(e):
-                raise
-            raise Exception(f"API调用错误: {str(e)}")
+            raise self._openai_error(e)
     
-    async def _call_anthropic(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    def _anthropic_request(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str],
+        temperature: Optional[float]
+    ) -> tuple[str, dict, dict]:
+        """构建Anthropic API的请求地址、请求头和请求体"""
+        body = {
+            **self._anthropic_body,
+            "system": [{
+                "type": "text",
+                "text": system_prompt or DEFAULT_SYSTEM_PROMPT,
+                **self._anthropic_cache_control
+            }],
+            "messages": messages
+        }
+        if temperature is not None:
+            body["temperature"] = temperature
+        return "https://api.anthropic.com/v1/messages", self._anthropic_headers, body
+    
+    async def _call_anthropic(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        response_schema: Optional[type[BaseModel]] = None
+    ) -> str:
         """调用Anthropic API"""
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "x-api-key": self.llm_config.anthropic_key,
-                    "anthropic-version": "2023-06-01",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.llm_config.anthropic_model,
-                    "max_tokens": 4096,
-                    "system": system_prompt or "You are a helpful coding assistant.",
-                    "messages": [{"role": "user", "content": prompt}]
-                }
-            )
+        url, headers, body = self._anthropic_request(messages, system_prompt, temperature)
+        if response_schema is not None:
+            # 强制调用报告工具，工具参数即为结构化输出
+            body["tools"] = [{
+                "name": "report",
+                "description": "提交结构化结果",
+                "input_schema": response_schema.model_json_schema()
+            }]
+            body["tool_choice"] = {"type": "tool", "name": "report"}
+        
+        response = await _post(url, headers, body)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        
+        if response_schema is not None:
+            for block in data["content"]:
+                if block["type"] == "tool_use":
+                    return orjson.dumps(block["input"]).decode()
+        return data["content"][0]["text"]
+    
+    async def _stream_anthropic(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """以SSE方式调用Anthropic API"""
+        url, headers, body = self._anthropic_request(messages, system_prompt, temperature)
+        body["stream"] = True
+        
+        async with _stream(url, headers, body) as response:
+            if response.is_error:
+                await response.aread()
             response.raise_for_status()
-            data = response.json()
-            return data["content"][0]["text"]
+            
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = orjson.loads(line[6:])
+                if event.get("type") == "content_block_delta":
+                    text = event["delta"].get("text")
+                    if text:
+                        yield text
+                elif event.get("type") == "message_stop":
+                    break
     
-    @abstractmethod
     async def execute(self, *args, **kwargs):
-        """执行智能体任务"""
-        pass
+        """执行智能体任务，由子类实现"""
+        raise NotImplementedError
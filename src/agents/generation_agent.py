@@ -1,6 +1,10 @@
 """指导性程序生成智能体 - 对应论文3.3节"""
-from typing import Optional
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
 from .base_agent import BaseAgent
+from ._extract import extractor_for, language_tags
+from ..config import config
 from ..models.code_metadata import CodeMetadata, FunctionInfo
 from ..models.analysis_result import HarnessResult
 
@@ -17,89 +21,164 @@ SYSTEM_PROMPT = """你是一个专业的模糊测试驱动程序生成专家。
 输出格式: 只输出代码，不要解释。代码用```c或```cpp包裹。
 """
 
+# 提示词末尾固定的生成要求
+_REQUIREMENTS = """
+要求:
+1. 使用 LLVMFuzzerTestOneInput 作为入口函数
+2. 从模糊输入数据中提取参数值
+3. 添加必要的边界检查
+4. 处理可能的异常情况"""
+
+# 项目上下文中列出的函数数量上限
+_CATALOG_LIMIT = 50
+
+def _signature(func: FunctionInfo) -> str:
+    """格式化函数签名"""
+    params_str = ", ".join(
+        f"{p.type}{' *' if p.is_pointer else ''} {p.name}" for p in func.params
+    )
+    return f"{func.return_type} {func.name}({params_str})"
+
+def _format_function(func: FunctionInfo) -> str:
+    """格式化目标函数签名、说明及参数约束提示"""
+    text = f"  {_signature(func)}\n"
+    if func.docstring:
+        text += f"    // {func.docstring[:200]}\n"
+    # 添加参数约束提示
+    return text + "".join(
+        f"    // 注意: {p.name} 是指针类型，需要正确初始化\n"
+        for p in func.params if p.is_pointer
+    )
+
 class GenerationAgent(BaseAgent):
     """指导性程序生成智能体"""
     
     def __init__(self):
         super().__init__("GenerationAgent")
+        # 最近一次构建的项目上下文前缀 (metadata, prefix)
+        self._prefix_cache: Optional[tuple[CodeMetadata, str]] = None
     
     async def execute(self, metadata: CodeMetadata, target_functions: list[FunctionInfo]) -> HarnessResult:
         """生成模糊测试驱动程序"""
         prompt = self._build_prompt(metadata, target_functions)
-        response = await self.call_llm(prompt, SYSTEM_PROMPT)
         
-        # 提取代码
-        harness_code = self._extract_code(response)
+        # 流式接收并提取代码，代码块结束即停止生成
+        harness_code = await self._extract_code_streaming(
+            self.stream_llm(prompt, SYSTEM_PROMPT), metadata.language
+        )
         
         return HarnessResult(
             harness_code=harness_code,
             target_functions=[f.name for f in target_functions]
         )
     
-    def _build_prompt(self, metadata: CodeMetadata, functions: list[FunctionInfo]) -> str:
-        """构建提示词 - 对应论文3.2节"""
-        lines = [
-            f"请为以下{metadata.language.upper()}函数生成模糊测试驱动程序:",
-            ""
+    async def execute_batch(
+        self,
+        metadata: CodeMetadata,
+        function_groups: list[list[FunctionInfo]]
+    ) -> list[HarnessResult]:
+        """并发为多组目标函数生成驱动程序，并发数受 llm.max_concurrency 限制"""
+        semaphore = asyncio.Semaphore(config.llm.max_concurrency)
+        
+        async def generate(functions: list[FunctionInfo]) -> HarnessResult:
+            async with semaphore:
+                return await self.execute(metadata, functions)
+        
+        return list(await asyncio.gather(*[generate(g) for g in function_groups]))
+    
+    def _build_prompt(self, metadata: CodeMetadata, functions: list[FunctionInfo]) -> list[dict]:
+        """构建提示词 - 对应论文3.2节
+        
+        项目上下文在同一项目的多次生成中保持不变，作为可缓存的前缀块
+        （LLM_PROMPT_CACHE=off 时不标记）；目标函数作为每次变化的后缀块。
+        """
+        return [
+            {
+                "type": "text",
+                "text": self._project_prefix(metadata),
+                **self._anthropic_cache_control
+            },
+            {"type": "text", "text": self._target_suffix(functions)}
         ]
+    
+    def _project_prefix(self, metadata: CodeMetadata) -> str:
+        """构建项目上下文前缀（头文件 + 函数目录），同一元数据只构建一次"""
+        if self._prefix_cache is not None and self._prefix_cache[0] is metadata:
+            return self._prefix_cache[1]
         
         # 添加头文件信息
+        includes = ""
         if metadata.includes:
-            lines.append("需要包含的头文件:")
-            for inc in metadata.includes[:10]:
-                lines.append(f"  #include <{inc}>")
-            lines.append("")
+            includes = "需要包含的头文件:\n" + "".join(
+                f"  #include <{inc}>\n" for inc in metadata.includes[:10]
+            ) + "\n"
         
-        # 添加目标函数信息
-        lines.append("目标函数:")
-        for func in functions:
-            params_str = ", ".join([
-                f"{p.type}{' *' if p.is_pointer else ''} {p.name}" 
-                for p in func.params
-            ])
-            lines.append(f"  {func.return_type} {func.name}({params_str})")
-            
-            if func.docstring:
-                lines.append(f"    // {func.docstring[:200]}")
-            
-            # 添加参数约束提示
-            for p in func.params:
-                if p.is_pointer:
-                    lines.append(f"    // 注意: {p.name} 是指针类型，需要正确初始化")
-        
-        lines.extend([
-            "",
-            "要求:",
-            "1. 使用 LLVMFuzzerTestOneInput 作为入口函数",
-            "2. 从模糊输入数据中提取参数值",
-            "3. 添加必要的边界检查",
-            "4. 处理可能的异常情况"
-        ])
+        catalog = "".join(
+            f"  {_signature(func)}\n" for func in metadata.functions[:_CATALOG_LIMIT]
+        )
         
-        return "\n".join(lines)
+        prefix = (
+            f"请为以下{metadata.language.upper()}函数生成模糊测试驱动程序:\n\n"
+            f"{includes}项目中的函数:\n{catalog}\n"
+        )
+        self._prefix_cache = (metadata, prefix)
+        return prefix
+    
+    def _target_suffix(self, functions: list[FunctionInfo]) -> str:
+        """构建本次生成的目标函数部分"""
+        # 添加目标函数信息
+        targets = "".join(_format_function(func) for func in functions)
+        return f"目标函数:\n{targets}{_REQUIREMENTS}"
     
-    def _extract_code(self, response: str) -> str:
-        """从LLM响应中提取代码"""
-        # 尝试提取代码块
-        if "```c" in response:
-            start = response.find("```c") + 4
-            end = response.find("```", start)
-            if end > start:
-                return response[start:end].strip()
+    def _extract_code(self, response: str, language: str = "c") -> str:
+        """从LLM响应中提取代码，优先取目标语言的代码块"""
+        return extractor_for(language)(response)
+    
+    async def _extract_code_streaming(
+        self,
+        chunks: AsyncIterator[str],
+        language: str = "c"
+    ) -> str:
+        """从流式响应中提取第一个目标语言的代码块，遇到其结束的```即关闭流
         
-        if "```cpp" in response:
-            start = response.find("```cpp") + 6
-            end = response.find("```", start)
-            if end > start:
-                return response[start:end].strip()
+        其他标识的代码块（如shell命令）整块跳过，与 _extract_code 的选择一致。
+        """
+        tags = language_tags(language)
+        buffer = ""
+        body_start = -1
+        matched = False
+        search_from = 0
         
-        if "```" in response:
-            start = response.find("```") + 3
-            end = response.find("```", start)
-            if end > start:
-                return response[start:end].strip()
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                buffer += chunk
+                
+                while True:
+                    if body_start < 0:
+                        # 等待开始标记及其所在行（语言标识）完整到达
+                        fence = buffer.find("```", search_from)
+                        if fence < 0:
+                            search_from = max(search_from, len(buffer) - 2)
+                            break
+                        newline = buffer.find("\n", fence + 3)
+                        if newline < 0:
+                            search_from = fence
+                            break
+                        # 标识可能带行尾空白或CRLF的\r
+                        matched = buffer[fence + 3:newline].strip().lower() in tags
+                        body_start = search_from = newline + 1
+                    
+                    end = buffer.find("```", search_from)
+                    if end < 0:
+                        search_from = max(body_start, len(buffer) - 2)
+                        break
+                    if matched:
+                        return buffer[body_start:end].strip()
+                    body_start = -1
+                    search_from = end + 3
         
-        return response.strip()
+        # 流结束仍未找到目标语言的代码块，按完整响应处理
+        return self._extract_code(buffer, language)
     
     async def generate_for_api_combination(
         self, 
@@ -107,18 +186,37 @@ class GenerationAgent(BaseAgent):
         api_names: list[str]
     ) -> HarnessResult:
         """为指定的API组合生成驱动程序"""
-        # 查找对应的函数信息
-        target_functions = [
-            f for f in metadata.functions 
-            if f.name in api_names
-        ]
+        results = await self.generate_for_api_combinations(metadata, [api_names])
+        return results[0]
+    
+    async def generate_for_api_combinations(
+        self,
+        metadata: CodeMetadata,
+        combinations: list[list[str]]
+    ) -> list[HarnessResult]:
+        """为多个API组合并发生成驱动程序，结果顺序与输入一致"""
+        results: list[Optional[HarnessResult]] = [None] * len(combinations)
+        pending: list[tuple[int, list[FunctionInfo]]] = []
+        
+        for i, api_names in enumerate(combinations):
+            # 查找对应的函数信息
+            target_functions = [
+                f for f in metadata.functions 
+                if f.name in api_names
+            ]
+            
+            if target_functions:
+                pending.append((i, target_functions))
+            else:
+                results[i] = HarnessResult(
+                    harness_code="",
+                    target_functions=api_names,
+                    compile_success=False,
+                    errors=[{"message": "No matching functions found"}]
+                )
         
-        if not target_functions:
-            return HarnessResult(
-                harness_code="",
-                target_functions=api_names,
-                compile_success=False,
-                errors=[{"message": "No matching functions found"}]
-            )
+        harnesses = await self.execute_batch(metadata, [g for _, g in pending])
+        for (i, _), harness in zip(pending, harnesses):
+            results[i] = harness
         
-        return await self.execute(metadata, target_functions)
+        return results
@@ -1,6 +1,7 @@
 """覆盖率指导变异智能体 - 对应论文3.5节"""
 import random
-from typing import Optional
+from collections import deque
+from typing import Optional, Sequence, Union
 from .base_agent import BaseAgent
 from ..models.code_metadata import CodeMetadata, FunctionInfo
 from ..models.analysis_result import CoverageInfo, HarnessResult
@@ -17,21 +18,56 @@ SYSTEM_PROMPT = """你是一个模糊测试优化专家。
 输出格式: JSON格式，包含建议的API组合和变异策略。
 """
 
+# 保留的覆盖率历史轮数，须大于execute中判断增长缓慢所需的轮数
+_COVERAGE_HISTORY = 8
+
+# 已测试组合：引擎传入排序后元组的集合，也兼容组合列表
+TestedCombinations = Union[set[tuple[str, ...]], list[list[str]]]
+
+# 提示词中列出的最近测试过的组合数
+_PROMPT_RECENT_COMBINATIONS = 10
+
 class MutationAgent(BaseAgent):
     """覆盖率指导变异智能体"""
     
     def __init__(self):
         super().__init__("MutationAgent")
         self.api_weights: dict[str, float] = {}  # API权重
-        self.coverage_history: list[CoverageInfo] = []
+        # 只需最近几轮的覆盖率判断增益，长时间运行时不再无限增长
+        self.coverage_history: deque[CoverageInfo] = deque(maxlen=_COVERAGE_HISTORY)
+        self._rng = random.Random()
+        
+        # 已测试组合的增量索引，避免每次调用重建集合
+        self._tested_set: set[tuple[str, ...]] = set()
+        self._tested_seen = 0
+        self._tested_source: Optional[TestedCombinations] = None
+        
+        # API名称索引缓存，函数列表变化时重建
+        self._api_source: Optional[list[FunctionInfo]] = None
+        self._api_count = 0
+        self._public_apis: list[str] = []
+        self._valid_apis: frozenset[str] = frozenset()
+        # 公开API名称 -> 下标，及已单独测试过的API位图（下标对应 _public_apis）
+        self._name2idx: dict[str, int] = {}
+        self._tested_singletons = bytearray()
+        
+        # 按权重排序的API列表缓存，权重或函数列表变化时标记失效
+        self._priority_cache: Optional[list[str]] = None
+        self._priority_key: Optional[tuple] = None
+        self._priority_dirty = True
     
     async def execute(
         self, 
         metadata: CodeMetadata, 
         current_coverage: CoverageInfo,
-        tested_combinations: list[list[str]]
+        tested_combinations: TestedCombinations,
+        recent_combinations: Optional[Sequence[Sequence[str]]] = None
     ) -> list[list[str]]:
-        """根据覆盖率反馈生成新的API组合"""
+        """根据覆盖率反馈生成新的API组合
+        
+        tested_combinations 为集合时无序，recent_combinations 按测试顺序
+        提供最近的组合，供LLM提示词展示。
+        """
         # 更新覆盖率历史
         self.coverage_history.append(current_coverage)
         
@@ -42,7 +78,7 @@ class MutationAgent(BaseAgent):
         if coverage_gain < 5 and len(self.coverage_history) > 3:
             # 覆盖率增长缓慢，请求LLM建议
             new_combinations = await self._llm_suggest_combinations(
-                metadata, current_coverage, tested_combinations
+                metadata, current_coverage, tested_combinations, recent_combinations
             )
         else:
             # 使用启发式方法生成组合
@@ -69,10 +105,12 @@ class MutationAgent(BaseAgent):
         self,
         metadata: CodeMetadata,
         coverage: CoverageInfo,
-        tested: list[list[str]]
+        tested: TestedCombinations,
+        recent: Optional[Sequence[Sequence[str]]] = None
     ) -> list[list[str]]:
         """使用LLM建议新的API组合"""
-        prompt = self._build_suggestion_prompt(metadata, coverage, tested)
+        prompt = self._build_suggestion_prompt(metadata, coverage, tested, recent)
+        # 保持采样，每轮迭代得到不同的组合建议
         response = await self.call_llm(prompt, SYSTEM_PROMPT)
         
         # 解析响应
@@ -82,10 +120,16 @@ class MutationAgent(BaseAgent):
         self,
         metadata: CodeMetadata,
         coverage: CoverageInfo,
-        tested: list[list[str]]
+        tested: TestedCombinations,
+        recent: Optional[Sequence[Sequence[str]]] = None
     ) -> str:
         """构建建议提示词"""
-        available_apis = [f.name for f in metadata.functions]
+        # 提示词只列出前30个API，不遍历完整函数列表
+        available_apis = [f.name for f in metadata.functions[:30]]
+        # 集合无序，未提供最近组合时不列出
+        if recent is None:
+            recent = tested if isinstance(tested, list) else ()
+        recent = [list(combo) for combo in recent][-_PROMPT_RECENT_COMBINATIONS:]
         
         return f"""当前模糊测试状态:
 - 行覆盖率: {coverage.line_coverage:.1f}%
@@ -93,10 +137,10 @@ class MutationAgent(BaseAgent):
 - 新路径数: {coverage.new_paths}
 
 已测试的API组合:
-{tested[-10:] if len(tested) > 10 else tested}
+{recent}
 
 可用的API列表:
-{available_apis[:30]}
+{available_apis}
 
 请建议3-5个新的API组合，以提高覆盖率。
 每个组合包含1-3个API。
@@ -109,7 +153,8 @@ class MutationAgent(BaseAgent):
         metadata: CodeMetadata
     ) -> list[list[str]]:
         """解析LLM响应中的API组合"""
-        valid_apis = {f.name for f in metadata.functions}
+        self._sync_api_index(metadata)
+        valid_apis = self._valid_apis
         combinations = []
         
         for line in response.strip().split('\n'):
@@ -128,41 +173,104 @@ class MutationAgent(BaseAgent):
     def _heuristic_combinations(
         self,
         metadata: CodeMetadata,
-        tested: list[list[str]]
+        tested: TestedCombinations
     ) -> list[list[str]]:
         """启发式生成API组合"""
-        tested_set = {tuple(sorted(c)) for c in tested}
-        all_apis = [f.name for f in metadata.functions if f.is_public]
+        self._sync_api_index(metadata)
+        tested_set = self._sync_tested(tested)
+        all_apis = self._public_apis
         
         combinations = []
         
-        # 策略1: 单API测试
-        for api in all_apis:
-            if tuple([api]) not in tested_set:
+        # 策略1: 单API测试，直接在位图中查找未测试的下标，
+        # 位图未标记但集合中已有的API顺带补标记
+        mask = self._tested_singletons
+        idx = mask.find(0)
+        while idx >= 0 and len(combinations) < 2:
+            api = all_apis[idx]
+            if (api,) in tested_set:
+                mask[idx] = 1
+            else:
                 combinations.append([api])
-                if len(combinations) >= 2:
-                    break
+            idx = mask.find(0, idx + 1)
         
         # 策略2: 随机组合
-        for _ in range(3):
-            size = random.randint(2, min(3, len(all_apis)))
-            combo = random.sample(all_apis, size)
-            if tuple(sorted(combo)) not in tested_set:
-                combinations.append(combo)
+        if len(all_apis) >= 2:
+            max_size = min(3, len(all_apis))
+            for _ in range(3):
+                combo = self._rng.sample(all_apis, self._rng.randint(2, max_size))
+                if tuple(sorted(combo)) not in tested_set:
+                    combinations.append(combo)
         
         return combinations[:5]
     
+    def _sync_tested(self, tested: TestedCombinations) -> set[tuple[str, ...]]:
+        """同步已测试组合集合
+        
+        引擎传入的元组集合直接复用，单API位图在查找时补标记；
+        列表则增量更新，只处理上次调用之后新增的组合。
+        """
+        if isinstance(tested, set):
+            if tested is not self._tested_source:
+                self._tested_source = tested
+                self._tested_singletons = bytearray(len(self._public_apis))
+            self._tested_set = tested
+            return tested
+        
+        if tested is not self._tested_source or len(tested) < self._tested_seen:
+            self._tested_set = set()
+            self._tested_seen = 0
+            self._tested_source = tested
+            self._tested_singletons = bytearray(len(self._public_apis))
+        
+        for i in range(self._tested_seen, len(tested)):
+            combo = tuple(sorted(tested[i]))
+            self._tested_set.add(combo)
+            if len(combo) == 1:
+                self._mark_singleton(combo[0])
+        self._tested_seen = len(tested)
+        
+        return self._tested_set
+    
+    def _sync_api_index(self, metadata: CodeMetadata):
+        """重建API名称索引（公开API列表、合法API集合），函数列表未变化时直接复用"""
+        functions = metadata.functions
+        if functions is not self._api_source or len(functions) != self._api_count:
+            self._api_source = functions
+            self._api_count = len(functions)
+            # 同名函数（如头文件声明与定义）只保留一个
+            self._public_apis = list(dict.fromkeys(f.name for f in functions if f.is_public))
+            self._valid_apis = frozenset(f.name for f in functions)
+            self._name2idx = {name: i for i, name in enumerate(self._public_apis)}
+            self._tested_singletons = bytearray(len(self._public_apis))
+            for combo in self._tested_set:
+                if len(combo) == 1:
+                    self._mark_singleton(combo[0])
+    
+    def _mark_singleton(self, api: str):
+        """在位图中标记已单独测试的API"""
+        idx = self._name2idx.get(api)
+        if idx is not None:
+            self._tested_singletons[idx] = 1
+    
     def update_api_weights(self, api_name: str, coverage_delta: float):
         """更新API权重"""
         current = self.api_weights.get(api_name, 1.0)
         # 覆盖率增益越大，权重越高
         self.api_weights[api_name] = current + coverage_delta * 0.1
+        self._priority_dirty = True
     
     def get_priority_apis(self, metadata: CodeMetadata, top_k: int = 10) -> list[str]:
-        """获取优先级最高的API"""
-        apis_with_weights = [
-            (f.name, self.api_weights.get(f.name, 1.0))
-            for f in metadata.functions
-        ]
-        apis_with_weights.sort(key=lambda x: x[1], reverse=True)
-        return [a[0] for a in apis_with_weights[:top_k]]
+        """获取优先级最高的API，排序结果缓存到权重或函数列表变化为止"""
+        functions = metadata.functions
+        key = (id(functions), len(functions), id(self.api_weights))
+        if self._priority_dirty or key != self._priority_key:
+            apis_with_weights = [
+                (f.name, self.api_weights.get(f.name, 1.0))
+                for f in functions
+            ]
+            apis_with_weights.sort(key=lambda x: x[1], reverse=True)
+            self._priority_cache = [a[0] for a in apis_with_weights]
+            self._priority_key = key
+            self._priority_dirty = False
+        return self._priority_cache[:top_k]
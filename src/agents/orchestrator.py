@@ -1,12 +1,22 @@
 """智能体协调器 - 协调三个智能体自主配合工作"""
+import asyncio
+import re
+from collections import Counter
 from typing import Optional
 from .analysis_agent import AnalysisAgent
 from .generation_agent import GenerationAgent
 from .repair_agent import RepairAgent
 from ..analyzers import ASTParser
-from ..models.code_metadata import CodeMetadata
-import tempfile
-from pathlib import Path
+from ..models.code_metadata import CodeMetadata, FunctionInfo
+
+# 漏洞标题行：以"### 问题"或"**问题"开头（忽略行首空白）
+_VULN_TITLE_RE = re.compile(r'^[^\S\n]*(?:### 问题|\*\*问题)[^\n]*', re.MULTILINE)
+
+# 标注严重程度的行
+_SEVERITY_LINE_RE = re.compile(r'^[^\n]*严重(?:程度|性)[^\n]*', re.MULTILINE)
+
+# 语言对应的源文件后缀，决定静态分析的解析方式
+_LANGUAGE_SUFFIX = {"c": ".c", "cpp": ".cpp", "python": ".py"}
 
 
 class AgentOrchestrator:
@@ -21,6 +31,11 @@ class AgentOrchestrator:
         self.generation_agent = GenerationAgent()
         self.repair_agent = RepairAgent()
         self.parser = ASTParser()
+        
+        # 各步骤调用的方法在构造时绑定一次，分析流程中直接调用
+        self._extract_functions = self.parser.extract_functions_from_source
+        self._analyze_and_fix = self.analysis_agent.analyze_and_fix
+        self._generate = self.generation_agent.execute
     
     async def analyze_code(self, code: str, language: str = "c") -> dict:
         """
@@ -45,9 +60,27 @@ class AgentOrchestrator:
         code_info = await self._static_analysis(code, language)
         result["code_info"] = code_info
         
+        # 第四步：内部模糊测试验证（不展示给用户）
+        # 驱动生成不依赖分析结果，与AI分析并发进行，LLM后端可合并批处理
+        fuzz_task = None
+        if code_info.get("functions"):
+            print("[协调器] 第4步: 内部验证测试（与分析并发）...")
+            # 模糊测试驱动在内部使用，不返回给用户
+            fuzz_task = asyncio.create_task(
+                self._internal_fuzz_test(code, language, code_info)
+            )
+        
         # 第二步：AI安全分析 - 检测漏洞
+        # 第三步：生成修复后的代码（与分析在同一对话中进行，发现漏洞时才执行）
         print("[协调器] 第2步: AI安全漏洞分析...")
-        security_result = await self.analysis_agent.execute(code, language)
+        try:
+            security_result = await self._analyze_and_fix(
+                code, language, fix_if=self._should_fix
+            )
+        except BaseException:
+            if fuzz_task is not None:
+                fuzz_task.cancel()
+            raise
         
         if security_result["success"]:
             result["security_analysis"] = security_result["analysis"]
@@ -55,33 +88,43 @@ class AgentOrchestrator:
             result["vulnerabilities"] = self._parse_vulnerabilities(
                 security_result["analysis"]
             )
+            result["fixed_code"] = security_result["fixed_code"]
         else:
+            result["success"] = False
             result["security_analysis"] = f"分析失败: {security_result.get('error', '未知错误')}"
         
-        # 第三步：生成修复后的代码
-        if result["vulnerabilities"]:
-            print("[协调器] 第3步: 生成修复代码...")
-            fix_result = await self.analysis_agent.generate_fixed_code(
-                code, result["security_analysis"], language
-            )
-            if fix_result["success"]:
-                result["fixed_code"] = fix_result["fixed_code"]
-        
-        # 第四步：内部模糊测试验证（不展示给用户）
-        if code_info.get("functions"):
-            print("[协调器] 第4步: 内部验证测试...")
-            # 模糊测试驱动在内部使用，不返回给用户
-            await self._internal_fuzz_test(code, language, code_info)
+        if fuzz_task is not None:
+            if result["vulnerabilities"]:
+                await fuzz_task
+            else:
+                # 未发现漏洞时无需验证，中止尚未完成的驱动生成
+                print("[协调器] 未发现漏洞，跳过内部验证测试")
+                fuzz_task.cancel()
+                try:
+                    await fuzz_task
+                except asyncio.CancelledError:
+                    pass
         
         # 第五步：生成修复建议
         print("[协调器] 第5步: 生成修复建议...")
-        result["suggestions"] = self._generate_suggestions(result)
+        severity_counts = self._count_severities(result["vulnerabilities"])
+        result["suggestions"] = self._generate_suggestions(result, severity_counts)
         
         # 生成总结
-        result["summary"] = self._generate_summary(result)
+        result["summary"] = self._generate_summary(result, severity_counts)
+        
+        # 函数对象在内部流转，返回前转换为字典
+        result["code_info"] = self._serialize_code_info(code_info)
         
         return result
     
+    def _should_fix(self, analysis: str) -> bool:
+        """分析结果中发现漏洞时才生成修复代码"""
+        if self._parse_vulnerabilities(analysis):
+            print("[协调器] 第3步: 生成修复代码...")
+            return True
+        return False
+    
     async def _internal_fuzz_test(self, code: str, language: str, code_info: dict):
         """内部模糊测试 - 用于验证，不展示给用户"""
         try:
@@ -94,58 +137,43 @@ class AgentOrchestrator:
             print(f"[内部] 模糊测试跳过: {e}")
     
     async def _static_analysis(self, code: str, language: str) -> dict:
-        """静态分析 - 提取代码结构信息"""
-        # 创建临时文件
-        suffix = {"c": ".c", "cpp": ".cpp", "python": ".py"}.get(language, ".c")
+        """静态分析 - 提取代码结构信息
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix=suffix, delete=False) as f:
-            f.write(code)
-            temp_path = Path(f.name)
+        functions 为 FunctionInfo 对象列表，直接供驱动生成使用，
+        返回给用户前由 _serialize_code_info 转换。
+        """
+        # 直接在内存中解析，不写临时文件
+        functions = self._extract_functions(code, _LANGUAGE_SUFFIX.get(language, ".c"))
         
-        try:
-            functions = self.parser.extract_functions(temp_path)
-            
-            return {
-                "language": language,
-                "functions": [
-                    {
-                        "name": f.name,
-                        "return_type": f.return_type,
-                        "params": [{"name": p.name, "type": p.type, "is_pointer": p.is_pointer} 
-                                   for p in f.params],
-                        "line": f.line_number
-                    }
-                    for f in functions
-                ],
-                "function_count": len(functions),
-                "line_count": len(code.split('\n'))
-            }
-        finally:
-            temp_path.unlink(missing_ok=True)
+        return {
+            "language": language,
+            "functions": functions,
+            "function_count": len(functions),
+            "line_count": code.count('\n') + 1
+        }
+    
+    @staticmethod
+    def _serialize_code_info(code_info: dict) -> dict:
+        """将代码结构信息中的函数对象转换为字典"""
+        functions: list[FunctionInfo] = code_info.get("functions", [])
+        return {
+            **code_info,
+            "functions": [
+                {
+                    "name": f.name,
+                    "return_type": f.return_type,
+                    "params": [{"name": p.name, "type": p.type, "is_pointer": p.is_pointer} 
+                               for p in f.params],
+                    "line": f.line_number
+                }
+                for f in functions
+            ]
+        }
     
     async def _generate_harness(self, code: str, language: str, code_info: dict) -> dict:
         """生成模糊测试驱动"""
         try:
-            # 构建元数据
-            from ..models.code_metadata import FunctionInfo, FunctionParam
-            
-            functions = []
-            for f in code_info.get("functions", []):
-                params = [
-                    FunctionParam(
-                        name=p["name"],
-                        type=p["type"],
-                        is_pointer=p.get("is_pointer", False)
-                    )
-                    for p in f.get("params", [])
-                ]
-                functions.append(FunctionInfo(
-                    name=f["name"],
-                    return_type=f["return_type"],
-                    params=params,
-                    file_path="",
-                    line_number=f.get("line", 0)
-                ))
+            functions: list[FunctionInfo] = code_info.get("functions", [])
             
             if not functions:
                 return {"harness_code": ""}
@@ -156,45 +184,54 @@ class AgentOrchestrator:
                 functions=functions
             )
             
-            harness = await self.generation_agent.execute(metadata, functions[:3])
+            harness = await self._generate(metadata, functions[:3])
             return {"harness_code": harness.harness_code}
         except Exception as e:
             return {"harness_code": f"// 生成失败: {str(e)}"}
     
     def _parse_vulnerabilities(self, analysis: str) -> list:
-        """从分析结果中解析漏洞列表"""
+        """从分析结果中解析漏洞列表
+        
+        一次正则扫描定位所有标题行，两个标题之间的各行为该问题的详情。
+        """
         vulnerabilities = []
+        titles = list(_VULN_TITLE_RE.finditer(analysis))
         
-        # 简单解析，查找"问题"关键词
-        lines = analysis.split('\n')
-        current_vuln = None
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('### 问题') or line.startswith('**问题'):
-                if current_vuln:
-                    vulnerabilities.append(current_vuln)
-                current_vuln = {"title": line, "details": [], "severity": "中"}
-            elif current_vuln:
-                if '严重程度' in line or '严重性' in line:
+        for i, match in enumerate(titles):
+            # 详情从标题的下一行开始，到下一个标题的前一行结束
+            start = match.end() + 1
+            end = titles[i + 1].start() - 1 if i + 1 < len(titles) else len(analysis)
+            body = analysis[start:end] if start <= end else None
+            
+            severity = "中"
+            if body:
+                for line in _SEVERITY_LINE_RE.findall(body):
                     if '高' in line:
-                        current_vuln["severity"] = "高"
+                        severity = "高"
                     elif '低' in line:
-                        current_vuln["severity"] = "低"
-                current_vuln["details"].append(line)
-        
-        if current_vuln:
-            vulnerabilities.append(current_vuln)
+                        severity = "低"
+            
+            vulnerabilities.append({
+                "title": match.group().strip(),
+                "details": [line.strip() for line in body.split('\n')] if body is not None else [],
+                "severity": severity
+            })
         
         return vulnerabilities
     
-    def _generate_suggestions(self, result: dict) -> list:
+    @staticmethod
+    def _count_severities(vulns: list) -> Counter:
+        """一次遍历统计各严重程度的漏洞数量"""
+        return Counter(v.get("severity") for v in vulns)
+    
+    def _generate_suggestions(self, result: dict, severity_counts: Optional[Counter] = None) -> list:
         """生成修复建议"""
         suggestions = []
         
-        vulns = result.get("vulnerabilities", [])
-        high_count = sum(1 for v in vulns if v.get("severity") == "高")
-        medium_count = sum(1 for v in vulns if v.get("severity") == "中")
+        if severity_counts is None:
+            severity_counts = self._count_severities(result.get("vulnerabilities", []))
+        high_count = severity_counts["高"]
+        medium_count = severity_counts["中"]
         
         if high_count > 0:
             suggestions.append(f"🚨 发现 {high_count} 个高危漏洞，建议立即修复")
@@ -205,28 +242,30 @@ class AgentOrchestrator:
         if result.get("fixed_code"):
             suggestions.append("✅ 已自动生成修复后的代码，请查看下方")
         
+        # 同名函数（如不同条件编译分支中的定义）只提示一次
         code_info = result.get("code_info", {})
-        for func in code_info.get("functions", []):
-            for param in func.get("params", []):
-                if param.get("is_pointer"):
-                    suggestions.append(f"💡 函数 {func['name']} 使用指针参数，已添加空指针检查")
-                    break
+        seen = set()
+        for func in code_info.get("functions") or ():
+            if func.name not in seen and any(p.is_pointer for p in func.params):
+                seen.add(func.name)
+                suggestions.append(f"💡 函数 {func.name} 使用指针参数，已添加空指针检查")
         
         return suggestions
     
-    def _generate_summary(self, result: dict) -> str:
+    def _generate_summary(self, result: dict, severity_counts: Optional[Counter] = None) -> str:
         """生成分析总结"""
         vulns = result.get("vulnerabilities", [])
         code_info = result.get("code_info", {})
         
-        high = sum(1 for v in vulns if v.get("severity") == "高")
-        medium = sum(1 for v in vulns if v.get("severity") == "中")
-        low = sum(1 for v in vulns if v.get("severity") == "低")
-        
         summary = f"代码分析完成。共 {code_info.get('line_count', 0)} 行代码，"
         summary += f"{code_info.get('function_count', 0)} 个函数。"
         
         if vulns:
+            if severity_counts is None:
+                severity_counts = self._count_severities(vulns)
+            high = severity_counts["高"]
+            medium = severity_counts["中"]
+            low = severity_counts["低"]
             summary += f"\n发现 {len(vulns)} 个潜在问题"
             if high > 0:
                 summary += f"（高危 {high} 个"
@@ -1,6 +1,9 @@
 """错误驱动程序验证修复智能体 - 对应论文3.4节"""
+import asyncio
+import re
 from typing import Optional
 from .base_agent import BaseAgent
+from ._extract import extract_code
 from ..models.analysis_result import HarnessResult, CodeError, ErrorType, Severity
 
 SYSTEM_PROMPT = """你是一个专业的代码修复专家。
@@ -16,6 +19,22 @@ SYSTEM_PROMPT = """你是一个专业的代码修复专家。
 输出格式: 只输出修复后的完整代码，用```c或```cpp包裹。
 """
 
+# 每轮并发生成的修复候选所用的温度，温度不同使候选之间有差异
+_SPECULATIVE_TEMPERATURES = (0.2, 0.7, 1.0)
+
+# 错误分类规则，按顺序匹配第一条: (模式, 错误类型, 严重程度, 修复建议)
+_ERROR_PATTERNS = [
+    (re.compile(r'undefined reference|undeclared', re.IGNORECASE),
+     ErrorType.UNDEFINED_SYMBOL, Severity.ERROR, "检查是否缺少头文件或链接库"),
+    # 锚定到开头，避免search在每个偏移处重试前瞻导致二次复杂度
+    (re.compile(r'\A(?=.*type)(?=.*(?:mismatch|incompatible))', re.IGNORECASE | re.DOTALL),
+     ErrorType.TYPE_MISMATCH, Severity.ERROR, "检查参数类型是否正确"),
+    (re.compile(r'syntax error|expected', re.IGNORECASE),
+     ErrorType.SYNTAX, Severity.ERROR, "检查语法错误"),
+    (re.compile(r'segmentation fault|null pointer', re.IGNORECASE),
+     ErrorType.MEMORY, Severity.CRITICAL, "检查指针是否正确初始化"),
+]
+
 class RepairAgent(BaseAgent):
     """错误驱动程序验证修复智能体"""
     
@@ -26,11 +45,12 @@ class RepairAgent(BaseAgent):
     async def execute(
         self, 
         harness: HarnessResult, 
-        error_info: str
+        error_info: str,
+        temperature: Optional[float] = None
     ) -> HarnessResult:
         """修复错误的驱动程序"""
         prompt = self._build_repair_prompt(harness.harness_code, error_info)
-        response = await self.call_llm(prompt, SYSTEM_PROMPT)
+        response = await self.call_llm(prompt, SYSTEM_PROMPT, temperature)
         
         fixed_code = self._extract_code(response)
         
@@ -58,57 +78,20 @@ class RepairAgent(BaseAgent):
     
     def _extract_code(self, response: str) -> str:
         """从响应中提取代码"""
-        for marker in ["```c", "```cpp", "```"]:
-            if marker in response:
-                start = response.find(marker) + len(marker)
-                end = response.find("```", start)
-                if end > start:
-                    return response[start:end].strip()
-        return response.strip()
+        return extract_code(response)
     
     def classify_error(self, error_message: str) -> CodeError:
         """分类错误类型"""
-        error_lower = error_message.lower()
-        
-        if "undefined reference" in error_lower or "undeclared" in error_lower:
-            return CodeError(
-                type=ErrorType.UNDEFINED_SYMBOL,
-                severity=Severity.ERROR,
-                message=error_message,
-                file_path="",
-                line=0,
-                suggestion="检查是否缺少头文件或链接库"
-            )
-        
-        if "type" in error_lower and ("mismatch" in error_lower or "incompatible" in error_lower):
-            return CodeError(
-                type=ErrorType.TYPE_MISMATCH,
-                severity=Severity.ERROR,
-                message=error_message,
-                file_path="",
-                line=0,
-                suggestion="检查参数类型是否正确"
-            )
-        
-        if "syntax error" in error_lower or "expected" in error_lower:
-            return CodeError(
-                type=ErrorType.SYNTAX,
-                severity=Severity.ERROR,
-                message=error_message,
-                file_path="",
-                line=0,
-                suggestion="检查语法错误"
-            )
-        
-        if "segmentation fault" in error_lower or "null pointer" in error_lower:
-            return CodeError(
-                type=ErrorType.MEMORY,
-                severity=Severity.CRITICAL,
-                message=error_message,
-                file_path="",
-                line=0,
-                suggestion="检查指针是否正确初始化"
-            )
+        for pattern, error_type, severity, suggestion in _ERROR_PATTERNS:
+            if pattern.search(error_message):
+                return CodeError(
+                    type=error_type,
+                    severity=severity,
+                    message=error_message,
+                    file_path="",
+                    line=0,
+                    suggestion=suggestion
+                )
         
         return CodeError(
             type=ErrorType.RUNTIME,
@@ -123,21 +106,35 @@ class RepairAgent(BaseAgent):
         harness: HarnessResult, 
         validator_func
     ) -> HarnessResult:
-        """迭代修复直到成功或达到最大尝试次数"""
+        """迭代修复直到成功或达到最大尝试次数
+        
+        每轮以不同温度并发生成多个修复候选并同时验证，取第一个通过验证的候选；
+        都未通过时以第一个候选继续下一轮修复。
+        """
         current_harness = harness
+        # 验证当前代码
+        is_valid, error_info = await validator_func(current_harness.harness_code)
         
         for attempt in range(self.max_repair_attempts):
-            # 验证当前代码
-            is_valid, error_info = await validator_func(current_harness.harness_code)
-            
             if is_valid:
                 current_harness.compile_success = True
                 return current_harness
             
-            # 尝试修复
-            current_harness = await self.execute(current_harness, error_info)
+            # 并发尝试修复
+            candidates = await asyncio.gather(*[
+                self.execute(current_harness, error_info, temperature)
+                for temperature in _SPECULATIVE_TEMPERATURES
+            ])
+            results = await asyncio.gather(*[
+                validator_func(candidate.harness_code) for candidate in candidates
+            ])
+            
+            best = next((i for i, (ok, _) in enumerate(results) if ok), 0)
+            current_harness = candidates[best]
             current_harness.errors.append(
                 self.classify_error(error_info)
             )
+            is_valid, error_info = results[best]
         
+        current_harness.compile_success = is_valid
         return current_harness
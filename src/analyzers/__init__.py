@@ -1,3 +1,4 @@
 """代码分析器模块"""
 from .ast_parser import ASTParser
+from .ast_cache import ASTCache, ast_cache
 from .metadata_extractor import MetadataExtractor
@@ -0,0 +1,143 @@
+"""AST解析结果的磁盘缓存 - 按文件内容哈希索引，跨进程、跨重启复用"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+from ..config import config
+
+# 解析逻辑变化时递增，使旧的缓存条目全部失效
+PARSER_VERSION = 3
+
+class ASTCache:
+    """基于SQLite的解析结果缓存
+    
+    数据库首次使用时打开（每个进程单独连接），打开失败则缓存不生效，
+    解析照常进行。条目数超过上限时按最近访问时间淘汰。
+    """
+    
+    def __init__(self, db_path: Optional[Path] = None, max_entries: Optional[int] = None):
+        self._db_path = Path(db_path) if db_path is not None else None
+        self._max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_key: Optional[tuple[int, Path]] = None
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def db_path(self) -> Path:
+        """数据库路径，未指定时位于配置的缓存目录下"""
+        return self._db_path or config.cache_dir / "ast.sqlite"
+    
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries if self._max_entries is not None else config.ast_cache_size
+    
+    @staticmethod
+    def make_key(kind: str, file_path: Path, content: bytes) -> str:
+        """由解析类型、文件路径和内容哈希生成缓存键"""
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        return f"{PARSER_VERSION}:{kind}:{file_path}:{digest}"
+    
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """获取当前进程的数据库连接，fork出的子进程或路径变化时重新连接"""
+        db_path = self.db_path
+        conn_key = (os.getpid(), db_path)
+        if self._conn_key == conn_key:
+            return self._conn
+        
+        if self._conn is not None and self._conn_key[0] == conn_key[0]:
+            self._conn.close()
+        self._conn_key = conn_key
+        self._conn = None
+        try:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ast_entries "
+                "(key TEXT PRIMARY KEY, value BLOB, accessed REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ast_entries_accessed ON ast_entries (accessed)"
+            )
+            self._count = conn.execute("SELECT COUNT(*) FROM ast_entries").fetchone()[0]
+            self._conn = conn
+        except (OSError, sqlite3.Error):
+            pass
+        return self._conn
+    
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或读取失败返回None"""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value FROM ast_entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                with conn:
+                    conn.execute(
+                        "UPDATE ast_entries SET accessed = ? WHERE key = ?", (time.time(), key)
+                    )
+                return pickle.loads(row[0])
+            except (sqlite3.Error, pickle.UnpicklingError, EOFError):
+                return None
+    
+    def set(self, key: str, value: Any):
+        """写入缓存，条目数超过上限时淘汰最久未访问的条目，写入失败时忽略"""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO ast_entries (key, value, accessed) VALUES (?, ?, ?)",
+                        (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+                    )
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._trim(conn)
+            except sqlite3.Error:
+                pass
+    
+    def _trim(self, conn: sqlite3.Connection):
+        """删除最久未访问的条目，多删除上限的十分之一，避免之后每次写入都触发淘汰
+        
+        计数在本进程内累加，可能因覆盖写入或其他进程写入而偏离，
+        淘汰时重新统计一次。
+        """
+        keep = self.max_entries - self.max_entries // 10
+        with conn:
+            conn.execute(
+                "DELETE FROM ast_entries WHERE key IN ("
+                "SELECT key FROM ast_entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (keep,)
+            )
+        self._count = conn.execute("SELECT COUNT(*) FROM ast_entries").fetchone()[0]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connection()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM ast_entries")
+                self._count = 0
+    
+    def __len__(self) -> int:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return 0
+            return conn.execute("SELECT COUNT(*) FROM ast_entries").fetchone()[0]
+
+ast_cache = ASTCache()
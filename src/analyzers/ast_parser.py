@@ -1,17 +1,123 @@
 """AST解析器 - 基于Clang和Tree-sitter"""
+import ast
+import functools
+import os
+import re
+import signal
 import subprocess
+import tempfile
+import threading
+from io import StringIO
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Optional, TypeVar
+from .ast_cache import ast_cache
 from ..models.code_metadata import FunctionInfo, FunctionParam, TypeDefinition
 
+try:
+    from clang import cindex
+except ImportError:  # 未安装libclang时回退到clang命令行和正则匹配
+    cindex = None
+
+try:
+    # RE2为线性时间的DFA引擎，不会灾难性回溯，匹配时释放GIL
+    import re2 as _regex
+except ImportError:
+    _regex = re
+
+T = TypeVar("T")
+
+def _kill_group(proc: subprocess.Popen, sig: int):
+    """结束子进程所在的进程组（编译器可能是包装脚本，其子进程也会占用输出管道）"""
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+# AST文本输出的长度上限
+_AST_DUMP_LIMIT = 10000
+
+# include语句，<>和""两种形式
+_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+# include区域之后允许出现的代码行数，超过即认为头部已结束
+_INCLUDE_SCAN_SLACK = 20
+
+def _header_includes(lines: Iterable[str]) -> list[str]:
+    """提取文件头部的include
+
+    include都集中在文件头部，逐行匹配，遇到足够多的代码行后提前结束，
+    不再扫描函数体部分
+    """
+    includes = []
+    seen_code = 0
+    for line in lines:
+        match = _INCLUDE_RE.match(line)
+        if match:
+            includes.append(match.group(1))
+            continue
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('#', '//', '/*', '*')):
+            continue
+        seen_code += 1
+        if seen_code > _INCLUDE_SCAN_SLACK:
+            break
+    return includes
+
+# 简单的函数签名匹配 - 只匹配函数定义（带花括号的）
+_C_FUNC_RE = _regex.compile(r'(\w+(?:\s*\*)?)\s+(\w+)\s*\(([^)]*)\)\s*\{')
+
+# 会被函数签名正则误匹配的关键字
+_C_KEYWORDS = frozenset({'if', 'while', 'for', 'switch', 'return'})
+
+# 标准库函数，需要过滤
+_STDLIB_FUNCS = frozenset({
+    'printf', 'scanf', 'malloc', 'free', 'calloc', 'realloc',
+    'strcpy', 'strncpy', 'strcat', 'strlen', 'strcmp', 'strstr',
+    'memcpy', 'memset', 'memmove', 'memcmp',
+    'atoi', 'atof', 'atol', 'strtol', 'strtod',
+    'fopen', 'fclose', 'fread', 'fwrite', 'fprintf', 'fscanf',
+    'exit', 'abort', 'assert', 'sizeof'
+})
+
 class ASTParser:
     """抽象语法树解析器"""
     
     def __init__(self):
-        self._check_clang()
+        self._clang_available()
+        self._cache = ast_cache
+        self._index = self._create_index()
+        # 最近一次解析的翻译单元 ((路径, mtime, 大小), tu)，供parse_file和extract_functions共用
+        self._last_tu: Optional[tuple] = None
+        # 最近一次解析的Python语法树，结构同上
+        self._last_py_tree: Optional[tuple] = None
+    
+    @staticmethod
+    def _create_index():
+        """创建进程内的libclang索引，libclang不可用时返回None"""
+        if cindex is None:
+            return None
+        try:
+            return cindex.Index.create()
+        except Exception:
+            return None
     
-    def _check_clang(self) -> bool:
-        """检查Clang是否可用"""
+    @property
+    def _backend(self) -> str:
+        """当前C/C++解析后端，不同后端的结果分开缓存"""
+        return "libclang" if self._index is not None else "clang-cli"
+    
+    def _functions_kind(self, suffix: str) -> Optional[str]:
+        """函数提取结果的缓存类型，文件和内存源码共用；不支持的后缀返回None"""
+        if suffix == '.py':
+            return "py-functions"
+        if suffix in ['.c', '.h', '.cpp', '.hpp']:
+            return f"c-functions:{self._backend}"
+        return None
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _clang_available() -> bool:
+        """检查Clang是否可用，结果在进程内缓存，各实例共用"""
         try:
             result = subprocess.run(
                 ["clang", "--version"], 
@@ -21,6 +127,21 @@ class ASTParser:
         except Exception:
             return False
     
+    def _cached(self, kind: str, file_path: Path, compute: Callable[[], T]) -> T:
+        """按文件内容查询磁盘缓存，未命中时解析并写入；解析出错的结果不缓存"""
+        try:
+            content = file_path.read_bytes()
+        except OSError:
+            return compute()
+        
+        key = self._cache.make_key(kind, file_path, content)
+        result = self._cache.get(key)
+        if result is None:
+            result = compute()
+            if not (isinstance(result, dict) and "error" in result):
+                self._cache.set(key, result)
+        return result
+    
     def parse_file(self, file_path: Path) -> dict:
         """解析单个文件，提取AST信息"""
         if not file_path.exists():
@@ -28,57 +149,164 @@ class ASTParser:
         
         suffix = file_path.suffix.lower()
         if suffix in ['.c', '.h']:
-            return self._parse_c_file(file_path)
+            return self._cached(
+                f"c-ast:{self._backend}", file_path, lambda: self._parse_c_file(file_path)
+            )
         elif suffix in ['.cpp', '.hpp', '.cc', '.cxx']:
-            return self._parse_cpp_file(file_path)
+            return self._cached(
+                f"cpp-ast:{self._backend}", file_path, lambda: self._parse_cpp_file(file_path)
+            )
         elif suffix == '.py':
-            return self._parse_python_file(file_path)
+            return self._cached("py-ast", file_path, lambda: self._parse_python_file(file_path))
         else:
             return {"error": f"Unsupported file type: {suffix}"}
     
     def _parse_c_file(self, file_path: Path) -> dict:
         """解析C文件"""
+        if self._index is not None:
+            return self._parse_with_libclang(file_path)
+        # 使用clang -ast-dump获取AST
+        return self._run_ast_dump("clang", file_path)
+    
+    def _parse_cpp_file(self, file_path: Path) -> dict:
+        """解析C++文件"""
+        if self._index is not None:
+            return self._parse_with_libclang(file_path)
+        return self._run_ast_dump("clang++", file_path)
+    
+    def _run_ast_dump(self, compiler: str, file_path: Path, timeout: int = 30) -> dict:
+        """运行clang -ast-dump，只读取输出的前 _AST_DUMP_LIMIT 字节，读够即结束子进程
+        
+        AST在解析完成后才输出，读到输出时诊断信息已全部写入stderr。
+        stderr写入临时文件，避免管道写满导致子进程阻塞。
+        """
+        timed_out = []
+        
+        def kill():
+            timed_out.append(True)
+            _kill_group(proc, signal.SIGKILL)
+        
         try:
-            # 使用clang -ast-dump获取AST
-            result = subprocess.run(
-                ["clang", "-Xclang", "-ast-dump", "-fsyntax-only", str(file_path)],
-                capture_output=True, text=True, timeout=30
-            )
-            return {
-                "success": result.returncode == 0,
-                "ast_dump": result.stdout[:10000] if result.stdout else "",
-                "errors": result.stderr if result.stderr else ""
-            }
-        except subprocess.TimeoutExpired:
-            return {"error": "AST parsing timeout"}
+            with tempfile.TemporaryFile() as stderr:
+                proc = subprocess.Popen(
+                    [compiler, "-Xclang", "-ast-dump", "-fsyntax-only", str(file_path)],
+                    stdout=subprocess.PIPE, stderr=stderr, start_new_session=True
+                )
+                timer = threading.Timer(timeout, kill)
+                timer.start()
+                try:
+                    dump = proc.stdout.read(_AST_DUMP_LIMIT)
+                    proc.stdout.close()
+                    # 输出未读完时提前结束clang
+                    finished = proc.poll() is not None
+                    if not finished:
+                        _kill_group(proc, signal.SIGTERM)
+                    proc.wait()
+                finally:
+                    timer.cancel()
+                
+                if timed_out:
+                    return {"error": "AST parsing timeout"}
+                
+                stderr.seek(0)
+                errors = stderr.read().decode('utf-8', errors='ignore')
         except Exception as e:
             return {"error": str(e)}
+        
+        return {
+            # 被提前结束时返回码无意义，以是否有错误诊断判断
+            "success": proc.returncode == 0 if finished else "error:" not in errors,
+            "ast_dump": dump.decode('utf-8', errors='ignore'),
+            "errors": errors
+        }
     
-    def _parse_cpp_file(self, file_path: Path) -> dict:
-        """解析C++文件"""
+    def _translation_unit(self, file_path: Path, content: Optional[str] = None):
+        """用libclang解析文件，同一文件未修改时复用上次的翻译单元
+        
+        content 为已读入的文件内容，传入时libclang不再重复读取文件。
+        """
+        stat = file_path.stat()
+        key = (str(file_path), stat.st_mtime_ns, stat.st_size)
+        if self._last_tu is not None and self._last_tu[0] == key:
+            return self._last_tu[1]
+        
+        suffix = file_path.suffix.lower()
+        args = ['-x', 'c'] if suffix in ['.c', '.h'] else ['-x', 'c++']
+        unsaved_files = [(str(file_path), content)] if content is not None else None
+        tu = self._index.parse(str(file_path), args=args, unsaved_files=unsaved_files)
+        self._last_tu = (key, tu)
+        return tu
+    
+    def _parse_with_libclang(self, file_path: Path) -> dict:
+        """在进程内解析C/C++文件，不再启动clang子进程"""
         try:
-            result = subprocess.run(
-                ["clang++", "-Xclang", "-ast-dump", "-fsyntax-only", str(file_path)],
-                capture_output=True, text=True, timeout=30
-            )
-            return {
-                "success": result.returncode == 0,
-                "ast_dump": result.stdout[:10000] if result.stdout else "",
-                "errors": result.stderr if result.stderr else ""
-            }
+            tu = self._translation_unit(file_path)
         except Exception as e:
             return {"error": str(e)}
+        
+        diagnostics = list(tu.diagnostics)
+        return {
+            "success": all(d.severity < cindex.Diagnostic.Error for d in diagnostics),
+            "ast_dump": self._dump_cursor(tu),
+            "errors": "\n".join(d.format() for d in diagnostics)
+        }
+    
+    @staticmethod
+    def _dump_cursor(tu) -> str:
+        """输出本文件内声明的AST结构（跳过头文件），达到长度上限即停止遍历"""
+        lines = []
+        size = 0
+        main_file = tu.spelling
+        stack = [
+            (child, 0) for child in reversed(list(tu.cursor.get_children()))
+            if child.location.file and child.location.file.name == main_file
+        ]
+        while stack and size < _AST_DUMP_LIMIT:
+            cursor, depth = stack.pop()
+            line = f"{'  ' * depth}{cursor.kind.name} {cursor.spelling} <line:{cursor.location.line}>"
+            lines.append(line)
+            size += len(line) + 1
+            stack.extend((child, depth + 1) for child in reversed(list(cursor.get_children())))
+        return "\n".join(lines)[:_AST_DUMP_LIMIT]
+    
+    def _python_tree(self, file_path: Path) -> ast.Module:
+        """解析Python文件，同一文件未修改时复用上次的语法树"""
+        stat = file_path.stat()
+        key = (str(file_path), stat.st_mtime_ns, stat.st_size)
+        if self._last_py_tree is not None and self._last_py_tree[0] == key:
+            return self._last_py_tree[1]
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        self._last_py_tree = (key, tree)
+        return tree
+    
+    @staticmethod
+    def _dump_python_tree(tree: ast.Module) -> str:
+        """输出Python语法树结构，达到长度上限即停止遍历，不生成完整的ast.dump文本"""
+        lines = []
+        size = 0
+        stack = [(node, 0) for node in reversed(tree.body)]
+        while stack and size < _AST_DUMP_LIMIT:
+            node, depth = stack.pop()
+            name = getattr(node, 'name', None) or getattr(node, 'id', None) or getattr(node, 'arg', None)
+            line = f"{'  ' * depth}{type(node).__name__}"
+            if isinstance(name, str):
+                line += f" {name}"
+            if hasattr(node, 'lineno'):
+                line += f" <line:{node.lineno}>"
+            lines.append(line)
+            size += len(line) + 1
+            stack.extend((child, depth + 1) for child in reversed(list(ast.iter_child_nodes(node))))
+        return "\n".join(lines)[:_AST_DUMP_LIMIT]
     
     def _parse_python_file(self, file_path: Path) -> dict:
         """解析Python文件"""
-        import ast
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                source = f.read()
-            tree = ast.parse(source)
+            tree = self._python_tree(file_path)
             return {
                 "success": True,
-                "ast_dump": ast.dump(tree, indent=2)[:10000]
+                "ast_dump": self._dump_python_tree(tree)
             }
         except SyntaxError as e:
             return {"error": f"Syntax error: {e}"}
@@ -87,24 +315,103 @@ class ASTParser:
     
     def extract_functions(self, file_path: Path) -> list[FunctionInfo]:
         """从文件中提取函数信息"""
-        functions = []
         suffix = file_path.suffix.lower()
+        kind = self._functions_kind(suffix)
         
+        if kind is None:
+            return []
         if suffix == '.py':
-            functions = self._extract_python_functions(file_path)
-        elif suffix in ['.c', '.h', '.cpp', '.hpp']:
-            functions = self._extract_c_functions(file_path)
+            compute = lambda: self._extract_python_functions(file_path)
+        elif self._index is not None:
+            compute = lambda: self._extract_clang_functions(file_path)
+        else:
+            compute = lambda: self._extract_c_functions(file_path)
         
+        return self._cached(kind, file_path, compute)
+    
+    def extract_functions_from_source(self, source: str, suffix: str) -> list[FunctionInfo]:
+        """直接从内存中的源码提取函数，不写临时文件
+        
+        suffix 为源码对应的文件后缀（如 .c / .cpp / .py），决定解析方式。
+        """
+        suffix = suffix.lower()
+        buffer_path = Path(f"buffer{suffix}")
+        kind = self._functions_kind(suffix)
+        
+        if kind is None:
+            return []
+        if suffix == '.py':
+            compute = lambda: self._python_functions(source, buffer_path)
+        else:
+            compute = lambda: self._source_c_functions(source, buffer_path)
+        
+        key = self._cache.make_key(kind, buffer_path, source.encode('utf-8', errors='ignore'))
+        functions = self._cache.get(key)
+        if functions is None:
+            functions = compute()
+            self._cache.set(key, functions)
         return functions
     
+    def _source_c_functions(self, source: str, buffer_path: Path) -> list[FunctionInfo]:
+        """从内存中的C/C++源码提取函数，libclang以未保存文件的方式解析"""
+        if self._index is None:
+            return self._scan_c_functions(source, buffer_path)
+        
+        args = ['-x', 'c'] if buffer_path.suffix in ['.c', '.h'] else ['-x', 'c++']
+        try:
+            tu = self._index.parse(
+                str(buffer_path), args=args, unsaved_files=[(str(buffer_path), source)]
+            )
+        except Exception:
+            return []
+        return self._clang_functions(tu, buffer_path)
+    
+    def extract_functions_and_includes(self, file_path: Path) -> tuple[list[FunctionInfo], list[str]]:
+        """一次读取文件，同时提取函数信息和include的头文件"""
+        suffix = file_path.suffix.lower()
+        if suffix == '.py':
+            return self.extract_functions(file_path), []
+        
+        try:
+            raw = file_path.read_bytes()
+        except OSError:
+            return [], []
+        
+        key = self._cache.make_key(f"c-scan:{self._backend}", file_path, raw)
+        result = self._cache.get(key)
+        if result is None:
+            content = raw.decode('utf-8', errors='ignore')
+            functions = []
+            if suffix in ['.c', '.h', '.cpp', '.hpp']:
+                if self._index is not None:
+                    functions = self._extract_clang_functions(file_path, content)
+                else:
+                    functions = self._scan_c_functions(content, file_path)
+            result = (functions, _header_includes(StringIO(content)))
+            self._cache.set(key, result)
+        return result
+    
     def _extract_python_functions(self, file_path: Path) -> list[FunctionInfo]:
-        """提取Python函数"""
-        import ast
+        """提取Python函数，与parse_file共用语法树"""
+        try:
+            tree = self._python_tree(file_path)
+        except Exception:
+            return []
+        return self._tree_python_functions(tree, file_path)
+    
+    def _python_functions(self, source: str, file_path: Path) -> list[FunctionInfo]:
+        """从Python源码文本中提取函数"""
+        try:
+            tree = ast.parse(source)
+        except Exception:
+            return []
+        return self._tree_python_functions(tree, file_path)
+    
+    @staticmethod
+    def _tree_python_functions(tree: ast.Module, file_path: Path) -> list[FunctionInfo]:
+        """从已解析的Python语法树中提取函数"""
         functions = []
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                tree = ast.parse(f.read())
-            
             for node in ast.walk(tree):
                 if isinstance(node, ast.FunctionDef):
                     params = []
@@ -128,38 +435,78 @@ class ASTParser:
             pass
         return functions
     
+    def _extract_clang_functions(
+        self,
+        file_path: Path,
+        content: Optional[str] = None
+    ) -> list[FunctionInfo]:
+        """用libclang提取本文件中定义的C/C++函数"""
+        try:
+            tu = self._translation_unit(file_path, content)
+        except Exception:
+            return []
+        return self._clang_functions(tu, file_path)
+    
+    def _clang_functions(self, tu, file_path: Path) -> list[FunctionInfo]:
+        """遍历翻译单元，收集主文件中定义的函数"""
+        functions = []
+        main_file = tu.spelling
+        for cursor in tu.cursor.walk_preorder():
+            if cursor.kind != cindex.CursorKind.FUNCTION_DECL or not cursor.is_definition():
+                continue
+            if cursor.location.file is None or cursor.location.file.name != main_file:
+                continue
+            
+            params = []
+            for arg in cursor.get_arguments():
+                is_pointer = arg.type.kind == cindex.TypeKind.POINTER
+                # 与正则版本一致：指针参数记录指向的类型，由is_pointer标记指针
+                arg_type = arg.type.get_pointee() if is_pointer else arg.type
+                params.append(FunctionParam(
+                    name=arg.spelling,
+                    type=arg_type.spelling,
+                    is_pointer=is_pointer
+                ))
+            
+            parent = cursor.semantic_parent
+            functions.append(FunctionInfo(
+                name=cursor.spelling,
+                return_type=cursor.result_type.spelling,
+                params=params,
+                namespace=parent.spelling if parent.kind == cindex.CursorKind.NAMESPACE else None,
+                file_path=str(file_path),
+                line_number=cursor.location.line,
+                docstring=cursor.brief_comment,
+                # static函数无法从驱动程序中调用
+                is_public=cursor.storage_class != cindex.StorageClass.STATIC
+            ))
+        return functions
+    
     def _extract_c_functions(self, file_path: Path) -> list[FunctionInfo]:
         """提取C/C++函数 - 简化版本，使用正则匹配"""
-        import re
-        functions = []
-        
-        # 标准库函数，需要过滤
-        stdlib_funcs = {
-            'printf', 'scanf', 'malloc', 'free', 'calloc', 'realloc',
-            'strcpy', 'strncpy', 'strcat', 'strlen', 'strcmp', 'strstr',
-            'memcpy', 'memset', 'memmove', 'memcmp',
-            'atoi', 'atof', 'atol', 'strtol', 'strtod',
-            'fopen', 'fclose', 'fread', 'fwrite', 'fprintf', 'fscanf',
-            'exit', 'abort', 'assert', 'sizeof'
-        }
-        
         try:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
+        except Exception:
+            return []
+        return self._scan_c_functions(content, file_path)
+    
+    def _scan_c_functions(self, content: str, file_path: Path) -> list[FunctionInfo]:
+        """用正则从源码文本中匹配函数定义"""
+        functions = []
+        
+        try:
+            # 匹配按位置递增，行号在上一个匹配的基础上累加
+            line_num = 1
+            last_pos = 0
             
-            # 简单的函数签名匹配 - 只匹配函数定义（带花括号的）
-            pattern = r'(\w+(?:\s*\*)?)\s+(\w+)\s*\(([^)]*)\)\s*\{'
-            matches = re.finditer(pattern, content)
-            
-            for match in matches:
+            for match in _C_FUNC_RE.finditer(content):
                 return_type = match.group(1).strip()
                 func_name = match.group(2).strip()
                 params_str = match.group(3).strip()
                 
                 # 跳过关键字和标准库函数
-                if func_name in ['if', 'while', 'for', 'switch', 'return']:
-                    continue
-                if func_name in stdlib_funcs:
+                if func_name in _C_KEYWORDS or func_name in _STDLIB_FUNCS:
                     continue
                 
                 params = []
@@ -175,7 +522,8 @@ class ASTParser:
                                     is_pointer='*' in p
                                 ))
                 
-                line_num = content[:match.start()].count('\n') + 1
+                line_num += content.count('\n', last_pos, match.start())
+                last_pos = match.start()
                 functions.append(FunctionInfo(
                     name=func_name,
                     return_type=return_type,
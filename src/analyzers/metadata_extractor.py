@@ -1,10 +1,64 @@
 """代码库元数据提取器"""
+import os
 import yaml
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional
-from .ast_parser import ASTParser
+from .ast_parser import ASTParser, _header_includes
 from ..models.code_metadata import CodeMetadata, FunctionInfo, TypeDefinition
 
+try:
+    # libyaml的C实现，比纯Python解析快数倍
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+try:
+    import tomllib
+except ImportError:  # Python 3.11以下不支持TOML配置
+    tomllib = None
+
+# 未指定配置文件时按顺序查找
+_CONFIG_NAMES = ("fuzz_config.yaml", "fuzz_config.toml")
+
+# 各语言的源文件扩展名
+_EXTENSIONS = {
+    "c": frozenset({".c", ".h"}),
+    "cpp": frozenset({".cpp", ".hpp", ".cc", ".cxx", ".h"}),
+    "python": frozenset({".py"})
+}
+
+# 单个项目收集的源文件数量上限
+_MAX_SOURCE_FILES = 100
+
+# 文件数达到该值才启用进程池，少量文件串行扫描，避免进程启动开销
+_PARALLEL_MIN_FILES = 8
+
+# 工作进程内复用的解析器
+_worker_parser: Optional[ASTParser] = None
+
+def _walk_sources(root: Path, exts: frozenset[str], limit: int) -> list[Path]:
+    """一次遍历目录树，收集扩展名在 exts 中的文件，达到 limit 个即停止"""
+    files = []
+    if limit <= 0:
+        return files
+    for dirpath, dirnames, filenames in os.walk(root):
+        # 排序使收集结果稳定
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1] in exts:
+                files.append(Path(dirpath) / name)
+                if len(files) >= limit:
+                    return files
+    return files
+
+def _scan_one(path: Path) -> tuple[list[FunctionInfo], list[str]]:
+    """在工作进程中提取单个文件的函数和include（顶层函数，可被pickle）"""
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = ASTParser()
+    return _worker_parser.extract_functions_and_includes(path)
+
 class MetadataExtractor:
     """代码库元数据提取器 - 对应论文3.1节"""
     
@@ -16,7 +70,7 @@ class MetadataExtractor:
         project_path = Path(project_path)
         
         # 加载项目配置
-        project_config = self._load_config(config_path or project_path / "fuzz_config.yaml")
+        project_config = self._load_config(config_path or self._find_config(project_path))
         
         # 收集源文件
         source_files = self._collect_source_files(project_path, project_config)
@@ -26,12 +80,8 @@ class MetadataExtractor:
         all_types = []
         all_includes = set()
         
-        for src_file in source_files:
-            functions = self.parser.extract_functions(src_file)
+        for functions, includes in self._scan_files(source_files):
             all_functions.extend(functions)
-            
-            # 提取include
-            includes = self._extract_includes(src_file)
             all_includes.update(includes)
         
         return CodeMetadata(
@@ -43,59 +93,62 @@ class MetadataExtractor:
             source_files=[str(f) for f in source_files]
         )
     
+    def _scan_files(self, source_files: list[Path]) -> list[tuple[list[FunctionInfo], list[str]]]:
+        """提取各文件的函数和include，文件较多时用进程池并行扫描，结果保持文件顺序"""
+        if len(source_files) < _PARALLEL_MIN_FILES:
+            return [self.parser.extract_functions_and_includes(f) for f in source_files]
+        
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(source_files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_scan_one, source_files, chunksize=chunksize))
+    
+    def _find_config(self, project_path: Path) -> Path:
+        """查找项目配置文件，YAML优先，都不存在时返回默认的YAML路径"""
+        for name in _CONFIG_NAMES:
+            path = project_path / name
+            if path.exists():
+                return path
+        return project_path / _CONFIG_NAMES[0]
+    
     def _load_config(self, config_path: Path) -> dict:
-        """加载项目配置文件"""
-        if config_path.exists():
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
-        return {}
+        """加载项目配置文件，按后缀支持YAML和TOML"""
+        config_path = Path(config_path)
+        if not config_path.exists():
+            return {}
+        if config_path.suffix == ".toml" and tomllib is not None:
+            with open(config_path, 'rb') as f:
+                return tomllib.load(f)
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return yaml.load(f, Loader=_YamlLoader) or {}
     
     def _collect_source_files(self, project_path: Path, config: dict) -> list[Path]:
         """收集源代码文件"""
         language = config.get("language", "c")
         src_dirs = config.get("source_dirs", ["."])
-        
-        extensions = {
-            "c": [".c", ".h"],
-            "cpp": [".cpp", ".hpp", ".cc", ".cxx", ".h"],
-            "python": [".py"]
-        }.get(language, [".c", ".h"])
+        extensions = _EXTENSIONS.get(language, _EXTENSIONS["c"])
         
         files = []
         
         # 首先尝试配置的目录
         for src_dir in src_dirs:
             dir_path = project_path / src_dir
-            if dir_path.exists() and dir_path.is_dir():
-                for ext in extensions:
-                    files.extend(dir_path.rglob(f"*{ext}"))
+            if dir_path.is_dir():
+                files.extend(_walk_sources(dir_path, extensions, _MAX_SOURCE_FILES - len(files)))
         
         # 如果没找到，直接搜索项目目录
         if not files:
-            for ext in extensions:
-                files.extend(project_path.rglob(f"*{ext}"))
+            files = _walk_sources(project_path, extensions, _MAX_SOURCE_FILES)
         
-        return files[:100]  # 限制文件数量
+        return files
     
     def _extract_includes(self, file_path: Path) -> list[str]:
-        """提取include语句"""
-        includes = []
+        """提取include语句，逐行读取，头部结束后不再读取文件其余部分"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('#include'):
-                        # 提取头文件名
-                        if '<' in line:
-                            inc = line.split('<')[1].split('>')[0]
-                        elif '"' in line:
-                            inc = line.split('"')[1]
-                        else:
-                            continue
-                        includes.append(inc)
+            with open(file_path, 'rb') as f:
+                return _header_includes(raw.decode('utf-8', errors='ignore') for raw in f)
         except Exception:
-            pass
-        return includes
+            return []
     
     def to_prompt_context(self, metadata: CodeMetadata) -> str:
         """将元数据转换为提示词上下文"""
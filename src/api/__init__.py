@@ -1,2 +1,3 @@
 """API模块"""
-from .routes import router
+from .routes import router, close_temp_pool
+from .responses import ORJSONResponse
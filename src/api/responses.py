@@ -0,0 +1,10 @@
+"""API响应类"""
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+class ORJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
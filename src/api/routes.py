@@ -1,17 +1,71 @@
 """API路由"""
+import itertools
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from pydantic import BaseModel
-from typing import Optional
+from typing import Iterator, Optional
 import tempfile
-import shutil
+import aiofiles
 
+from ..agents import AgentOrchestrator, GenerationAgent
 from ..analyzers import MetadataExtractor, ASTParser
+from ..config import config
+from ..core import cleanup
+from ..core.llm_cache import response_cache
+from ..core.singleflight import SingleFlight
 from ..fuzzer import FuzzEngine
 from ..models.analysis_result import AnalysisResult
+from ..models.code_metadata import CodeMetadata
 
 router = APIRouter()
 
+# 上传文件每次读取写入的块大小
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 代码片段临时文件池：按后缀复用已创建的文件，避免每个请求都创建和删除文件
+_TEMP_POOL_SIZE = 64
+_temp_pool: defaultdict[str, deque[Path]] = defaultdict(deque)
+_temp_seq = itertools.count()
+
+# 相同代码的并发分析请求合并为一次LLM调用
+_inflight = SingleFlight()
+
+@contextmanager
+def _pooled_temp(code: str, suffix: str) -> Iterator[Path]:
+    """从池中取一个临时文件写入代码，用完后清空并放回池中"""
+    if not suffix[1:].isalnum():
+        suffix = ".txt"
+    pool = _temp_pool[suffix]
+    if pool:
+        path = pool.popleft()
+    else:
+        pool_dir = config.output_dir / "tmp"
+        pool_dir.mkdir(parents=True, exist_ok=True)
+        path = pool_dir / f"code_{next(_temp_seq)}{suffix}"
+    
+    path.write_text(code, encoding='utf-8')
+    try:
+        yield path
+    finally:
+        if len(pool) < _TEMP_POOL_SIZE:
+            path.write_bytes(b"")
+            pool.append(path)
+        else:
+            path.unlink(missing_ok=True)
+
+def close_temp_pool():
+    """删除池中的临时文件和池目录，服务关闭时调用"""
+    for pool in _temp_pool.values():
+        while pool:
+            pool.popleft().unlink(missing_ok=True)
+    try:
+        (config.output_dir / "tmp").rmdir()
+    except OSError:
+        pass
+
 class AnalyzeRequest(BaseModel):
     project_path: str
     max_iterations: int = 100
@@ -22,6 +76,27 @@ class CodeAnalyzeRequest(BaseModel):
     language: str = "c"
     filename: str = "code.c"
 
+@lru_cache(maxsize=1)
+def get_orchestrator() -> AgentOrchestrator:
+    """进程内共享的智能体协调器，不再每个请求重新创建"""
+    return AgentOrchestrator()
+
+@lru_cache(maxsize=1)
+def get_generation_agent() -> GenerationAgent:
+    """进程内共享的驱动生成智能体"""
+    return GenerationAgent()
+
+@lru_cache(maxsize=1)
+def get_parser() -> ASTParser:
+    """进程内共享的AST解析器，libclang索引只创建一次"""
+    return ASTParser()
+
+def _response_key(endpoint: str, request: CodeAnalyzeRequest) -> str:
+    """由接口、模型、语言和代码内容计算结果缓存键"""
+    llm = config.llm
+    model = llm.anthropic_model if llm.provider == "anthropic" else llm.openai_model
+    return response_cache.make_key(endpoint, llm.provider, model, request.language, request.code)
+
 @router.get("/")
 async def root():
     """根路径"""
@@ -40,7 +115,10 @@ async def root():
 
 
 @router.post("/analyze/security")
-async def analyze_security(request: CodeAnalyzeRequest) -> dict:
+async def analyze_security(
+    request: CodeAnalyzeRequest,
+    orchestrator: AgentOrchestrator = Depends(get_orchestrator)
+) -> dict:
     """
     🔥 一键代码安全分析（三个智能体协作）
     
@@ -50,16 +128,23 @@ async def analyze_security(request: CodeAnalyzeRequest) -> dict:
     3. 生成测试驱动 - 用于进一步测试
     4. 给出修复建议
     """
-    from ..agents import AgentOrchestrator
-    
     if not request.code or not request.code.strip():
         raise HTTPException(status_code=400, detail="代码不能为空")
     
-    orchestrator = AgentOrchestrator()
+    key = _response_key("security", request)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
     
-    try:
+    async def run_analysis() -> dict:
         result = await orchestrator.analyze_code(request.code, request.language)
+        # LLM限流、超时等失败结果不缓存，重试时重新分析
+        if result.get("success"):
+            response_cache.set(key, result)
         return result
+    
+    try:
+        return await _inflight.do(key, run_analysis)
     except Exception as e:
         error_msg = str(e)
         if "余额不足" in error_msg:
@@ -102,20 +187,12 @@ async def analyze_project(request: AnalyzeRequest) -> dict:
     }
 
 @router.post("/analyze/code")
-async def analyze_code(request: CodeAnalyzeRequest) -> dict:
+async def analyze_code(
+    request: CodeAnalyzeRequest,
+    parser: ASTParser = Depends(get_parser)
+) -> dict:
     """分析单个代码片段"""
-    parser = ASTParser()
-    
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(
-        mode='w', 
-        suffix=f".{request.language}",
-        delete=False
-    ) as f:
-        f.write(request.code)
-        temp_path = Path(f.name)
-    
-    try:
+    with _pooled_temp(request.code, f".{request.language}") as temp_path:
         # 解析AST
         ast_result = parser.parse_file(temp_path)
         
@@ -128,22 +205,23 @@ async def analyze_code(request: CodeAnalyzeRequest) -> dict:
             "errors": ast_result.get("errors", ""),
             "ast_preview": ast_result.get("ast_dump", "")[:2000]
         }
-    finally:
-        temp_path.unlink(missing_ok=True)
 
 @router.post("/analyze/upload")
-async def analyze_uploaded_file(file: UploadFile = File(...)) -> dict:
+async def analyze_uploaded_file(
+    file: UploadFile = File(...),
+    parser: ASTParser = Depends(get_parser)
+) -> dict:
     """分析上传的文件"""
     # 保存上传的文件
     temp_dir = Path(tempfile.mkdtemp())
     file_path = temp_dir / file.filename
     
     try:
-        with open(file_path, 'wb') as f:
-            content = await file.read()
-            f.write(content)
+        # 分块写入磁盘，内存占用不随上传文件大小增长
+        async with aiofiles.open(file_path, 'wb') as f:
+            while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
         
-        parser = ASTParser()
         ast_result = parser.parse_file(file_path)
         functions = parser.extract_functions(file_path)
         
@@ -154,57 +232,51 @@ async def analyze_uploaded_file(file: UploadFile = File(...)) -> dict:
             "function_count": len(functions)
         }
     finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        # 交给后台任务删除，不阻塞当前请求
+        cleanup.schedule_removal(temp_dir)
 
 @router.post("/generate/harness")
-async def generate_harness(request: CodeAnalyzeRequest) -> dict:
+async def generate_harness(
+    request: CodeAnalyzeRequest,
+    parser: ASTParser = Depends(get_parser),
+    agent: GenerationAgent = Depends(get_generation_agent)
+) -> dict:
     """为代码生成模糊测试驱动程序"""
-    from ..agents import GenerationAgent
-    from ..models.code_metadata import CodeMetadata
-    
     if not request.code or not request.code.strip():
         raise HTTPException(status_code=400, detail="代码不能为空")
     
-    parser = ASTParser()
+    key = _response_key("harness", request)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # 直接解析内存中的代码，不写临时文件
+    functions = parser.extract_functions_from_source(request.code, f".{request.language}")
+    
+    if not functions:
+        raise HTTPException(status_code=400, detail="未找到可分析的函数，请检查代码格式")
     
-    # 创建临时文件并解析
-    with tempfile.NamedTemporaryFile(
-        mode='w',
-        suffix=f".{request.language}",
-        delete=False
-    ) as f:
-        f.write(request.code)
-        temp_path = Path(f.name)
+    metadata = CodeMetadata(
+        project_name="uploaded_code",
+        language=request.language,
+        functions=functions
+    )
     
     try:
-        functions = parser.extract_functions(temp_path)
-        
-        if not functions:
-            raise HTTPException(status_code=400, detail="未找到可分析的函数，请检查代码格式")
-        
-        metadata = CodeMetadata(
-            project_name="uploaded_code",
-            language=request.language,
-            functions=functions
-        )
-        
-        agent = GenerationAgent()
-        
-        try:
-            harness = await agent.execute(metadata, functions[:5])
-        except Exception as e:
-            error_msg = str(e)
-            if "余额不足" in error_msg:
-                raise HTTPException(status_code=402, detail="API账户余额不足，请充值后重试")
-            elif "密钥无效" in error_msg:
-                raise HTTPException(status_code=401, detail="API密钥无效，请检查.env配置")
-            else:
-                raise HTTPException(status_code=500, detail=f"AI生成失败: {error_msg}")
-        
-        return {
-            "success": True,
-            "harness_code": harness.harness_code,
-            "target_functions": harness.target_functions
-        }
-    finally:
-        temp_path.unlink(missing_ok=True)
+        harness = await agent.execute(metadata, functions[:5])
+    except Exception as e:
+        error_msg = str(e)
+        if "余额不足" in error_msg:
+            raise HTTPException(status_code=402, detail="API账户余额不足，请充值后重试")
+        elif "密钥无效" in error_msg:
+            raise HTTPException(status_code=401, detail="API密钥无效，请检查.env配置")
+        else:
+            raise HTTPException(status_code=500, detail=f"AI生成失败: {error_msg}")
+    
+    result = {
+        "success": True,
+        "harness_code": harness.harness_code,
+        "target_functions": harness.target_functions
+    }
+    response_cache.set(key, result)
+    return result
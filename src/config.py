@@ -1,5 +1,6 @@
 """配置管理模块"""
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -13,6 +14,12 @@ class LLMConfig(BaseModel):
     openai_base_url: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
     anthropic_key: str = os.getenv("ANTHROPIC_API_KEY", "")
     anthropic_model: str = os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
+    max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    cache_size: int = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+    # 系统提示词前缀缓存: auto(仅OpenAI官方API发送缓存键) / on(总是发送，用于支持该参数的自建服务) / off
+    prompt_cache: str = os.getenv("LLM_PROMPT_CACHE", "auto")
+    # API层分析结果缓存的有效期（秒），0表示关闭
+    response_cache_ttl: int = int(os.getenv("LLM_RESPONSE_CACHE_TTL", "86400"))
 
 class FuzzerConfig(BaseModel):
     timeout: int = int(os.getenv("FUZZER_TIMEOUT", "60"))
@@ -30,12 +37,24 @@ class AppConfig(BaseModel):
     harness_dir: Path = output_dir / "harness"
     exception_dir: Path = output_dir / "exception"
     corpus_dir: Path = output_dir / "corpus"
+    # 持久化缓存目录（AST解析结果等）
+    cache_dir: Path = Path(os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "code-analyzer")))
+    # AST缓存保留的条目数上限，超出后淘汰最久未访问的条目
+    ast_cache_size: int = int(os.getenv("AST_CACHE_SIZE", "10000"))
 
     llm: LLMConfig = LLMConfig()
     fuzzer: FuzzerConfig = FuzzerConfig()
 
-config = AppConfig()
+@lru_cache(maxsize=1)
+def get_config() -> AppConfig:
+    """全局配置，进程内只创建一次"""
+    return AppConfig()
 
-# 确保输出目录存在
-for d in [config.output_dir, config.harness_dir, config.exception_dir, config.corpus_dir]:
-    d.mkdir(parents=True, exist_ok=True)
+@lru_cache(maxsize=1)
+def ensure_output_dirs():
+    """确保输出目录存在，首次写输出文件前调用，导入时不再创建目录"""
+    cfg = get_config()
+    for d in [cfg.output_dir, cfg.harness_dir, cfg.exception_dir, cfg.corpus_dir]:
+        d.mkdir(parents=True, exist_ok=True)
+
+config = get_config()
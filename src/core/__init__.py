@@ -0,0 +1,3 @@
+"""核心基础设施模块"""
+from .llm_cache import LLMCache, ResponseCache, llm_cache, response_cache
+from .singleflight import SingleFlight
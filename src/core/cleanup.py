@@ -0,0 +1,36 @@
+"""后台清理临时目录"""
+import asyncio
+import shutil
+from pathlib import Path
+from typing import Optional
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+
+async def _cleanup_worker(queue: asyncio.Queue):
+    """逐个删除队列中的目录，删除在线程池中进行，不阻塞事件循环"""
+    while True:
+        path = await queue.get()
+        try:
+            await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+        finally:
+            queue.task_done()
+
+def schedule_removal(path: Path):
+    """将目录加入后台删除队列后立即返回，首次调用时启动清理任务"""
+    global _queue, _worker
+    if _worker is None or _worker.done():
+        _queue = asyncio.Queue()
+        _worker = asyncio.create_task(_cleanup_worker(_queue))
+    _queue.put_nowait(path)
+
+async def drain():
+    """等待队列中的目录删除完毕并停止清理任务，服务关闭时调用"""
+    global _queue, _worker
+    if _worker is None:
+        return
+    if not _worker.done():
+        await _queue.join()
+        _worker.cancel()
+    _queue = None
+    _worker = None
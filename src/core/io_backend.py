@@ -0,0 +1,31 @@
+"""异步文件写入后端"""
+import asyncio
+import os
+from pathlib import Path
+from typing import Union
+
+import aiofiles
+
+async def write_file(path: Path, data: Union[str, bytes]):
+    """写入文件，不阻塞事件循环"""
+    if isinstance(data, str):
+        async with aiofiles.open(path, 'w', encoding='utf-8') as f:
+            await f.write(data)
+    else:
+        async with aiofiles.open(path, 'wb') as f:
+            await f.write(data)
+
+def _writev_file(path: Path, parts: list[bytes]):
+    """用一次writev写入全部片段，未写完的部分继续写入"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.writev(fd, parts)
+        rest = b"".join(parts)[written:] if written < sum(map(len, parts)) else b""
+        while rest:
+            rest = rest[os.write(fd, rest):]
+    finally:
+        os.close(fd)
+
+async def write_parts(path: Path, parts: list[bytes]):
+    """将多个片段依次写入文件，在线程池中以一次向量写完成"""
+    await asyncio.to_thread(_writev_file, path, parts)
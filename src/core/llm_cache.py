@@ -0,0 +1,116 @@
+"""LLM响应缓存"""
+import hashlib
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+
+from ..config import config
+
+class LLMCache:
+    """LRU缓存 - 按请求内容哈希缓存LLM响应"""
+    
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._data: OrderedDict[str, str] = OrderedDict()
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """由请求各组成部分计算缓存键"""
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时刷新为最近使用"""
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+    
+    def clear(self):
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+class ResponseCache:
+    """带过期时间的LRU缓存 - 按代码内容缓存API层的完整分析结果
+    
+    条目以 (过期时间戳, 结果) 保存，可在服务关闭时写入JSON文件、启动时读回。
+    """
+    
+    def __init__(self, capacity: int = 256, ttl: int = 86400, path: Optional[Path] = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.path = path
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+    
+    make_key = staticmethod(LLMCache.make_key)
+    
+    def get(self, key: str) -> Optional[Any]:
+        """读取未过期的结果，过期条目顺带删除"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+    
+    def set(self, key: str, value: Any):
+        """写入结果，ttl为0时不缓存"""
+        if self.ttl <= 0:
+            return
+        self._data[key] = (time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+    
+    def load(self):
+        """从JSON文件恢复未过期的条目，文件缺失或损坏时忽略"""
+        if self.path is None:
+            return
+        try:
+            entries = orjson.loads(self.path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return
+        now = time.time()
+        for key, (expires_at, value) in entries.items():
+            if expires_at > now:
+                self._data[key] = (expires_at, value)
+    
+    def save(self):
+        """将未过期的条目写入JSON文件"""
+        if self.path is None:
+            return
+        now = time.time()
+        entries = {k: v for k, v in self._data.items() if v[0] > now}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_bytes(orjson.dumps(entries))
+        except (OSError, TypeError):
+            pass
+    
+    def clear(self):
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+# 所有智能体共享的响应缓存
+llm_cache = LLMCache(config.llm.cache_size)
+
+# API层共享的分析结果缓存
+response_cache = ResponseCache(
+    ttl=config.llm.response_cache_ttl,
+    path=config.cache_dir / "responses.json"
+)
@@ -0,0 +1,33 @@
+"""并发请求合并"""
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """合并相同键的并发调用 - 同一时刻只执行一次，其余调用等待同一结果"""
+    
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+    
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """执行 func 并返回结果；相同键已有调用在执行时直接等待其结果
+        
+        实际执行放在独立任务中，某个等待方被取消（如客户端断开）不会中止共享的执行。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待方都已取消时，避免出现未获取异常的警告
+        if not task.cancelled():
+            task.exception()
+    
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -1,17 +1,20 @@
 """模糊测试引擎 - 核心调度器"""
 import asyncio
+import os
 import subprocess
+from collections import deque
 from pathlib import Path
 from typing import Optional, Callable
 from datetime import datetime
 
-from ..config import config
+from ..config import config, ensure_output_dirs
+from ..core import io_backend
 from ..models.code_metadata import CodeMetadata
 from ..models.analysis_result import HarnessResult, CoverageInfo, AnalysisResult
 from ..agents.generation_agent import GenerationAgent
 from ..agents.repair_agent import RepairAgent
 from ..agents.mutation_agent import MutationAgent
-from .validator import HarnessValidator
+from .validator import HarnessValidator, scan_fuzzer_output
 
 class FuzzEngine:
     """模糊测试引擎 - 协调三个智能体的工作"""
@@ -22,12 +25,22 @@ class FuzzEngine:
         self.mutation_agent = MutationAgent()
         self.validator = HarnessValidator()
         
-        self.tested_combinations: list[list[str]] = []
+        # 已测试组合，元素为排序后的API元组
+        self.tested_combinations: set[tuple[str, ...]] = set()
+        # 最近测试的组合（按测试顺序），集合无序，LLM提示词从这里取
+        self.recent_combinations: deque[tuple[str, ...]] = deque(maxlen=10)
         self.successful_harnesses: list[HarnessResult] = []
         self.failed_harnesses: list[HarnessResult] = []
         
         self.current_coverage = CoverageInfo()
         self.iteration = 0
+        
+        # 驱动程序文件名 = 本次运行的时间戳 + 递增序号，同一秒内保存多个也不会重名
+        self._run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._harness_seq = 0
+        
+        # 同时验证/运行的组合数，编译和模糊测试都是子进程，按CPU核数限制
+        self._combo_semaphore = asyncio.Semaphore(os.cpu_count() or 4)
     
     async def run(
         self, 
@@ -49,45 +62,28 @@ class FuzzEngine:
             api_combinations = await self.mutation_agent.execute(
                 metadata, 
                 self.current_coverage,
-                self.tested_combinations
+                self.tested_combinations,
+                self.recent_combinations
             )
             
             if not api_combinations:
                 print("  没有新的API组合可测试")
                 break
             
-            # 2. 为每个组合生成和测试驱动程序
-            for combo in api_combinations:
-                print(f"  测试组合: {combo}")
-                
-                # 生成驱动程序
-                harness = await self.generation_agent.generate_for_api_combination(
-                    metadata, combo
-                )
-                
-                if not harness.harness_code:
-                    print(f"    生成失败")
-                    continue
-                
-                # 验证和修复
-                harness = await self._validate_and_repair(harness, metadata.language)
-                
-                # 记录结果
-                self.tested_combinations.append(combo)
-                
-                if harness.compile_success:
-                    self.successful_harnesses.append(harness)
-                    self._save_harness(harness, "success")
-                    print(f"    ✓ 成功")
-                    
-                    # 运行模糊测试获取覆盖率
-                    coverage = await self._run_fuzzing(harness)
-                    if coverage:
-                        self._update_coverage(coverage)
-                else:
-                    self.failed_harnesses.append(harness)
-                    self._save_harness(harness, "failed")
-                    print(f"    ✗ 失败")
+            # 2. 并发生成所有组合的驱动程序，再并发验证和测试
+            harnesses = await self.generation_agent.generate_for_api_combinations(
+                metadata, api_combinations
+            )
+            
+            # 本轮所有驱动程序的语法检查合并为一次
+            syntax_results = await self.validator.validate_syntax_batch(
+                [harness.harness_code for harness in harnesses], metadata.language
+            )
+            
+            await asyncio.gather(*[
+                self._process_combo(combo, harness, metadata.language, syntax)
+                for combo, harness, syntax in zip(api_combinations, harnesses, syntax_results)
+            ])
             
             # 检查是否达到覆盖率阈值
             if self.current_coverage.line_coverage >= config.fuzzer.coverage_threshold:
@@ -99,16 +95,56 @@ class FuzzEngine:
         
         return self._build_result(metadata)
     
+    async def _process_combo(
+        self,
+        combo: list[str],
+        harness: HarnessResult,
+        language: str,
+        syntax: Optional[tuple[bool, str]] = None
+    ):
+        """验证、修复并测试单个组合的驱动程序
+        
+        syntax 为批量语法检查的结果。共享状态的修改之间没有await，
+        在事件循环中天然互斥，无需加锁。
+        """
+        if not harness.harness_code:
+            print(f"  测试组合: {combo}\n    生成失败")
+            return
+        
+        async with self._combo_semaphore:
+            # 验证和修复
+            harness = await self._validate_and_repair(harness, language, syntax)
+            
+            # 记录结果
+            key = tuple(sorted(combo))
+            self.tested_combinations.add(key)
+            self.recent_combinations.append(key)
+            
+            if harness.compile_success:
+                self.successful_harnesses.append(harness)
+                await self._save_harness(harness, "success")
+                print(f"  测试组合: {combo}\n    ✓ 成功")
+                
+                # 运行模糊测试获取覆盖率
+                coverage = await self._run_fuzzing(harness, language)
+                if coverage:
+                    self._update_coverage(coverage)
+            else:
+                self.failed_harnesses.append(harness)
+                await self._save_harness(harness, "failed")
+                print(f"  测试组合: {combo}\n    ✗ 失败")
+    
     async def _validate_and_repair(
         self, 
         harness: HarnessResult, 
-        language: str
+        language: str,
+        syntax: Optional[tuple[bool, str]] = None
     ) -> HarnessResult:
-        """验证并尝试修复驱动程序"""
+        """验证并尝试修复驱动程序，syntax 为已完成的语法检查结果"""
         # 首先验证语法
-        success, error = await self.validator.validate_syntax(
-            harness.harness_code, language
-        )
+        if syntax is None:
+            syntax = await self.validator.validate_syntax(harness.harness_code, language)
+        success, error = syntax
         
         if success:
             # 尝试完整编译
@@ -135,51 +171,52 @@ class FuzzEngine:
         
         return repaired
     
-    async def _run_fuzzing(self, harness: HarnessResult) -> Optional[CoverageInfo]:
+    async def _run_fuzzing(
+        self,
+        harness: HarnessResult,
+        language: str = "c"
+    ) -> Optional[CoverageInfo]:
         """运行模糊测试并收集覆盖率"""
-        success, output = await self.validator.run_quick_test(harness.harness_code)
+        success, output = await self.validator.run_quick_test(
+            harness.harness_code, language=language
+        )
         
-        # 解析覆盖率信息（简化版）
+        # 解析libFuzzer输出中的覆盖率，覆盖率只增不减，取最大值
         coverage = CoverageInfo()
-        
-        if "cov:" in output.lower():
-            # 尝试解析libFuzzer输出
-            try:
-                for line in output.split('\n'):
-                    if 'cov:' in line.lower():
-                        parts = line.split()
-                        for i, p in enumerate(parts):
-                            if p.lower() == 'cov:' and i + 1 < len(parts):
-                                coverage.covered_lines = int(parts[i + 1])
-            except Exception:
-                pass
+        covered = scan_fuzzer_output(output).coverage
+        if covered:
+            coverage.set_covered(covered)
         
         return coverage
     
     def _update_coverage(self, new_coverage: CoverageInfo):
         """更新覆盖率信息"""
-        self.current_coverage.covered_lines = max(
+        self.current_coverage.set_covered(max(
             self.current_coverage.covered_lines,
             new_coverage.covered_lines
-        )
+        ))
         self.current_coverage.new_paths += new_coverage.new_paths
     
-    def _save_harness(self, harness: HarnessResult, status: str):
+    async def _save_harness(self, harness: HarnessResult, status: str):
         """保存驱动程序到文件"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._harness_seq += 1
         func_names = "_".join(harness.target_functions[:2])
-        filename = f"harness_{func_names}_{timestamp}.c"
+        filename = f"harness_{func_names}_{self._run_id}_{self._harness_seq:06d}.c"
         
+        ensure_output_dirs()
         if status == "success":
             path = config.harness_dir / filename
         else:
             path = config.exception_dir / filename
         
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(f"// Target functions: {harness.target_functions}\n")
-            f.write(f"// Status: {status}\n")
-            f.write(f"// Generated: {timestamp}\n\n")
-            f.write(harness.harness_code)
+        header = (
+            f"// Target functions: {harness.target_functions}\n"
+            f"// Status: {status}\n"
+            f"// Generated: {self._run_id}\n\n"
+        )
+        await io_backend.write_parts(
+            path, [header.encode('utf-8'), harness.harness_code.encode('utf-8')]
+        )
     
     def _build_result(self, metadata: CodeMetadata) -> AnalysisResult:
         """构建最终结果"""
@@ -1,117 +1,350 @@
 """驱动程序验证器"""
+import asyncio
+import functools
+import hashlib
+import itertools
+import os
+import re
+import shutil
 import subprocess
 import tempfile
+from collections import OrderedDict
 from pathlib import Path
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple
 from ..config import config
+from ..core import io_backend
+
+try:
+    from clang import cindex
+except ImportError:  # 未安装libclang时语法检查回退到clang -fsyntax-only
+    cindex = None
+
+# 批量语法检查时诊断行中的源文件名 srcN.c / srcN.cpp
+_BATCH_FILE_RE = re.compile(r'(?:^|[\s/])src(\d+)\.(?:c|cpp):')
+
+# libFuzzer输出中关注的标记，一次扫描同时得到崩溃标志和覆盖率：
+# ERROR/SUMMARY 出现在 AddressSanitizer/LeakSanitizer 等崩溃报告中，
+# cov: N 出现在状态行中，如 "#2 INITED cov: 12 ft: 13 ..."
+_FUZZER_OUTPUT_RE = re.compile(r'(?P<crash>ERROR|SUMMARY)|(?<!\S)(?i:cov:)\s+(?P<cov>\d+)')
+
+class FuzzerScan(NamedTuple):
+    """libFuzzer输出的扫描结果"""
+    crashed: bool
+    coverage: int
+
+def scan_fuzzer_output(output: str) -> FuzzerScan:
+    """单遍扫描libFuzzer输出，返回是否崩溃及最大覆盖计数（覆盖率只增不减）"""
+    crashed = False
+    coverage = 0
+    for match in _FUZZER_OUTPUT_RE.finditer(output):
+        cov = match.group('cov')
+        if cov is None:
+            crashed = True
+        else:
+            coverage = max(coverage, int(cov))
+    return FuzzerScan(crashed, coverage)
+
+# 按源码哈希缓存的编译产物数量上限，超出时删除最久未使用的二进制
+_BINARY_CACHE_SIZE = 32
+
+# 驱动程序的编译选项，预编译头必须用相同选项生成
+_COMPILE_FLAGS = ["-fsanitize=fuzzer,address", "-g", "-O1"]
+
+# 驱动程序常用的标准头文件，预编译后每次编译不再重新解析
+_PRELUDE_HEADERS = ("stddef.h", "stdint.h", "stdio.h", "stdlib.h", "string.h")
+
+# 须在包含系统头文件之前定义才生效的功能测试宏，如 _GNU_SOURCE / _POSIX_C_SOURCE
+_FEATURE_MACRO_RE = re.compile(
+    r'^[ \t]*#[ \t]*define[ \t]+(?:_\w*_SOURCE|_FILE_OFFSET_BITS|_TIME_BITS|__STDC_\w+)\b',
+    re.MULTILINE
+)
+_INCLUDE_LINE_RE = re.compile(r'^[ \t]*#[ \t]*include\b', re.MULTILINE)
+
+def _defines_feature_macros(code: str) -> bool:
+    """源码是否在第一个include之前定义了功能测试宏
+    
+    -include-pch 会在源码之前包含预编译的标准头文件，这些宏随之失效，
+    此时不能使用预编译头。
+    """
+    macro = _FEATURE_MACRO_RE.search(code)
+    if macro is None:
+        return False
+    include = _INCLUDE_LINE_RE.search(code, 0, macro.start())
+    return include is None
+
+@functools.lru_cache(maxsize=1)
+def _clang_resource_dir() -> Optional[str]:
+    """本机clang的资源目录，libclang借此找到stddef.h等编译器内置头文件"""
+    try:
+        result = subprocess.run(
+            ["clang", "-print-resource-dir"],
+            capture_output=True, text=True, timeout=10
+        )
+    except Exception:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+async def _run_process(
+    cmd: list[str],
+    input: Optional[str] = None,
+    timeout: float = 30
+) -> Tuple[int, str, str]:
+    """异步运行子进程，返回 (退出码, stdout, stderr)；超时则结束进程并抛出TimeoutError"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            proc.communicate(input.encode('utf-8') if input is not None else None),
+            timeout=timeout
+        )
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        proc.kill()
+        await proc.wait()
+        raise
+    return (
+        proc.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace')
+    )
 
 class HarnessValidator:
     """驱动程序验证器 - 编译和运行时检查"""
     
     def __init__(self):
         self.temp_dir = Path(tempfile.mkdtemp())
+        self._index = self._create_index()
+        # 编译临时产物和语料目录的序号，并发验证时互不覆盖
+        self._seq = itertools.count()
+        # 源码哈希 -> 编译好的二进制，修复后验证与随后的快速测试共用同一次编译
+        self._bin_cache: OrderedDict[str, Path] = OrderedDict()
+        # 语言 -> 预编译头路径（生成失败为None），首次编译时生成
+        self._pch: dict[str, Optional[Path]] = {}
+        self._pch_lock = asyncio.Lock()
+    
+    @staticmethod
+    def _create_index():
+        """创建进程内的libclang索引，libclang不可用时返回None"""
+        if cindex is None:
+            return None
+        try:
+            return cindex.Index.create()
+        except Exception:
+            return None
     
     async def validate_compile(self, code: str, language: str = "c") -> Tuple[bool, str]:
         """验证代码是否能编译"""
-        # 写入临时文件
-        suffix = ".c" if language == "c" else ".cpp"
-        src_file = self.temp_dir / f"harness{suffix}"
-        out_file = self.temp_dir / "harness.out"
+        success, error, _ = await self._compile(code, language)
+        return success, error
+    
+    async def _compile(self, code: str, language: str) -> Tuple[bool, str, Optional[Path]]:
+        """编译驱动程序，返回 (是否成功, 错误信息, 二进制路径)
+        
+        源码经stdin传给编译器，不写临时文件；编译在异步子进程中进行，多个驱动程序
+        可以同时编译。相同源码已编译过时直接复用缓存的二进制。
+        """
+        key = hashlib.sha256(f"{language}\x1f{code}".encode('utf-8')).hexdigest()
+        cached = self._bin_cache.get(key)
+        if cached is not None and cached.exists():
+            self._bin_cache.move_to_end(key)
+            return True, "", cached
         
-        with open(src_file, 'w', encoding='utf-8') as f:
-            f.write(code)
+        # 先输出到唯一的临时文件，成功后再原子地改名，同一源码并发编译也不会互相覆盖
+        out_file = self.temp_dir / f"build_{next(self._seq)}.out"
         
         # 编译
         compiler = "clang" if language == "c" else "clang++"
-        cmd = [
-            compiler,
-            "-fsanitize=fuzzer,address",
-            "-g",
-            "-O1",
-            str(src_file),
-            "-o", str(out_file)
-        ]
+        cmd = [compiler, *_COMPILE_FLAGS]
+        if not _defines_feature_macros(code):
+            pch = await self._precompiled_header(language)
+            if pch is not None:
+                cmd += ["-include-pch", str(pch)]
+        cmd += ["-x", "c" if language == "c" else "c++", "-", "-o", str(out_file)]
         
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            returncode, _, stderr = await _run_process(cmd, input=code, timeout=30)
+        except asyncio.TimeoutError:
+            return False, "Compilation timeout", None
+        except FileNotFoundError:
+            return False, f"Compiler not found: {compiler}", None
+        except Exception as e:
+            return False, str(e), None
+        
+        if returncode != 0:
+            return False, stderr, None
+        
+        binary = self.temp_dir / f"{key}.out"
+        try:
+            os.replace(out_file, binary)
+        except OSError:
+            binary = out_file
+        self._bin_cache[key] = binary
+        self._bin_cache.move_to_end(key)
+        while len(self._bin_cache) > _BINARY_CACHE_SIZE:
+            _, evicted = self._bin_cache.popitem(last=False)
+            evicted.unlink(missing_ok=True)
+        return True, "", binary
+    
+    async def _precompiled_header(self, language: str) -> Optional[Path]:
+        """返回该语言的预编译头，首次调用时生成；编译器不可用或生成失败时返回None"""
+        if language in self._pch:
+            return self._pch[language]
+        
+        async with self._pch_lock:
+            if language not in self._pch:
+                lang = "c" if language == "c" else "c++"
+                prelude = self.temp_dir / f"prelude_{lang}.h"
+                prelude.write_text("".join(f"#include <{h}>\n" for h in _PRELUDE_HEADERS))
+                pch = prelude.with_suffix(".pch")
+                compiler = "clang" if language == "c" else "clang++"
+                cmd = [compiler, *_COMPILE_FLAGS, "-x", f"{lang}-header", str(prelude), "-o", str(pch)]
+                try:
+                    returncode, _, _ = await _run_process(cmd, timeout=30)
+                except Exception:
+                    returncode = -1
+                self._pch[language] = pch if returncode == 0 and pch.exists() else None
+        return self._pch[language]
+    
+    async def validate_syntax(self, code: str, language: str = "c") -> Tuple[bool, str]:
+        """仅验证语法（不链接），libclang可用时在进程内解析，不启动编译器"""
+        if self._index is not None:
+            return self._libclang_syntax(code, language)
+        
+        compiler = "clang" if language == "c" else "clang++"
+        cmd = [compiler, "-fsyntax-only", "-x", "c" if language == "c" else "c++", "-"]
+        
+        try:
+            returncode, _, stderr = await _run_process(cmd, input=code, timeout=10)
             
-            if result.returncode == 0:
+            if returncode == 0:
                 return True, ""
             else:
-                return False, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "Compilation timeout"
-        except FileNotFoundError:
-            return False, f"Compiler not found: {compiler}"
+                return False, stderr
         except Exception as e:
             return False, str(e)
     
-    async def validate_syntax(self, code: str, language: str = "c") -> Tuple[bool, str]:
-        """仅验证语法（不链接）"""
+    async def validate_syntax_batch(
+        self,
+        codes: list[str],
+        language: str = "c"
+    ) -> list[Tuple[bool, str]]:
+        """批量验证语法，结果与 codes 一一对应
+        
+        libclang可用时逐个在进程内解析；否则把所有源码写入同一目录，
+        只启动一次 clang -fsyntax-only，再按文件名拆分诊断信息。空代码直接判为失败。
+        """
+        if self._index is not None:
+            return [
+                self._libclang_syntax(code, language) if code else (False, "")
+                for code in codes
+            ]
+        
+        batch_dir = self.temp_dir / f"batch_{next(self._seq)}"
+        batch_dir.mkdir()
         suffix = ".c" if language == "c" else ".cpp"
-        src_file = self.temp_dir / f"syntax_check{suffix}"
+        indices = [i for i, code in enumerate(codes) if code]
+        sources = []
+        for i in indices:
+            src_file = batch_dir / f"src{i}{suffix}"
+            src_file.write_text(codes[i], encoding='utf-8')
+            sources.append(str(src_file))
         
-        with open(src_file, 'w', encoding='utf-8') as f:
-            f.write(code)
+        results: list[Tuple[bool, str]] = [(False, "")] * len(codes)
+        if not sources:
+            return results
         
         compiler = "clang" if language == "c" else "clang++"
-        cmd = [compiler, "-fsyntax-only", str(src_file)]
-        
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=10
+            returncode, _, stderr = await _run_process(
+                [compiler, "-fsyntax-only", *sources], timeout=10 + 2 * len(sources)
             )
-            
-            if result.returncode == 0:
-                return True, ""
-            else:
-                return False, result.stderr
+        except Exception as e:
+            for i in indices:
+                results[i] = (False, str(e))
+            return results
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        
+        # 诊断行归属于其中出现的源文件；不含文件名的行（如头文件中的错误）归属于上一个文件
+        diagnostics: dict[int, list[str]] = {i: [] for i in indices}
+        current = None
+        for line in stderr.splitlines():
+            match = _BATCH_FILE_RE.search(line)
+            if match and int(match.group(1)) in diagnostics:
+                current = int(match.group(1))
+            if current is not None:
+                diagnostics[current].append(line)
+        
+        # 编译失败但诊断无法归属到具体文件时，全部判为失败
+        unattributed = returncode != 0 and not any(diagnostics.values())
+        for i in indices:
+            if unattributed:
+                results[i] = (False, stderr)
+                continue
+            lines = diagnostics[i]
+            failed = any("error:" in line for line in lines)
+            results[i] = (not failed, "\n".join(lines) if failed else "")
+        return results
+    
+    def _libclang_syntax(self, code: str, language: str) -> Tuple[bool, str]:
+        """用libclang解析内存中的源码，收集错误级别的诊断"""
+        suffix = ".c" if language == "c" else ".cpp"
+        src_name = str(self.temp_dir / f"syntax_check{suffix}")
+        args = ['-x', 'c' if language == "c" else 'c++']
+        resource_dir = _clang_resource_dir()
+        if resource_dir:
+            args += ['-resource-dir', resource_dir]
+        
+        try:
+            tu = self._index.parse(src_name, args=args, unsaved_files=[(src_name, code)])
         except Exception as e:
             return False, str(e)
+        
+        errors = [d for d in tu.diagnostics if d.severity >= cindex.Diagnostic.Error]
+        return not errors, "\n".join(d.format() for d in errors)
     
-    async def run_quick_test(self, code: str, corpus_dir: Path = None) -> Tuple[bool, str]:
+    async def run_quick_test(
+        self,
+        code: str,
+        corpus_dir: Path = None,
+        language: str = "c"
+    ) -> Tuple[bool, str]:
         """快速运行测试"""
-        # 先编译
-        success, error = await self.validate_compile(code)
+        # 先按驱动程序的语言编译，刚验证过的源码直接复用缓存的二进制
+        success, error, out_file = await self._compile(code, language)
         if not success:
             return False, f"Compile error: {error}"
         
-        out_file = self.temp_dir / "harness.out"
-        corpus = corpus_dir or self.temp_dir / "corpus"
+        corpus = corpus_dir or self.temp_dir / f"corpus_{next(self._seq)}"
         corpus.mkdir(exist_ok=True)
         
         # 创建初始语料
-        (corpus / "seed").write_bytes(b"test")
+        await io_backend.write_file(corpus / "seed", b"test")
         
         try:
-            result = subprocess.run(
+            _, stdout, stderr = await _run_process(
                 [str(out_file), str(corpus), "-max_total_time=5"],
-                capture_output=True,
-                text=True,
                 timeout=10
             )
             
             # 检查是否有崩溃
-            if "ERROR" in result.stderr or "SUMMARY" in result.stderr:
-                return False, result.stderr
+            if scan_fuzzer_output(stderr).crashed:
+                return False, stderr
             
-            return True, result.stdout
-        except subprocess.TimeoutExpired:
+            # libFuzzer的状态行（含覆盖率）输出在stderr
+            return True, stdout + stderr
+        except asyncio.TimeoutError:
             return True, "Test completed (timeout)"
         except Exception as e:
             return False, str(e)
     
     def cleanup(self):
         """清理临时文件"""
-        import shutil
         try:
             shutil.rmtree(self.temp_dir)
         except Exception:
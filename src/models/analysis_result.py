@@ -1,4 +1,5 @@
 """分析结果模型"""
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Optional
 from pydantic import BaseModel
@@ -28,31 +29,49 @@ class CodeError(BaseModel):
     suggestion: Optional[str] = None
     fixed_code: Optional[str] = None
 
-class CoverageInfo(BaseModel):
+# CoverageInfo和HarnessResult只在引擎内部流转、每轮迭代大量创建，
+# 用slots数据类代替pydantic模型，省去校验开销；对外返回时由AnalysisResult校验
+@dataclass(slots=True)
+class CoverageInfo:
     """覆盖率信息"""
     total_lines: int = 0
     covered_lines: int = 0
     total_branches: int = 0
     covered_branches: int = 0
     new_paths: int = 0
+    # 覆盖率百分比，构造时计算，之后随 set_covered 更新（不要直接修改覆盖计数）
+    line_coverage: float = field(default=0.0, init=False)
+    branch_coverage: float = field(default=0.0, init=False)
     
-    @property
-    def line_coverage(self) -> float:
-        return (self.covered_lines / self.total_lines * 100) if self.total_lines > 0 else 0
+    def __post_init__(self):
+        self._update_percentages()
     
-    @property
-    def branch_coverage(self) -> float:
-        return (self.covered_branches / self.total_branches * 100) if self.total_branches > 0 else 0
+    def set_covered(self, lines: int, branches: Optional[int] = None):
+        """更新覆盖的行数（及分支数），同时重新计算覆盖率"""
+        self.covered_lines = lines
+        if branches is not None:
+            self.covered_branches = branches
+        self._update_percentages()
+    
+    def _update_percentages(self):
+        self.line_coverage = (self.covered_lines / self.total_lines * 100) if self.total_lines > 0 else 0
+        self.branch_coverage = (self.covered_branches / self.total_branches * 100) if self.total_branches > 0 else 0
 
-class HarnessResult(BaseModel):
+@dataclass(slots=True)
+class HarnessResult:
     """驱动程序生成结果"""
     harness_code: str
     target_functions: list[str]
     compile_success: bool = False
     run_success: bool = False
-    errors: list[CodeError] = []
+    errors: list[CodeError] = field(default_factory=list)
     coverage: Optional[CoverageInfo] = None
 
+class FixReport(BaseModel):
+    """修复代码的结构化输出"""
+    fixed_code: str
+    fixes: list[str] = []
+
 class AnalysisResult(BaseModel):
     """完整分析结果"""
     success: bool
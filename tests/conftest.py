@@ -0,0 +1,27 @@
+"""测试公共配置"""
+import pytest
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import config, ensure_output_dirs
+
+@pytest.fixture(autouse=True)
+def isolated_output(tmp_path, monkeypatch):
+    """输出目录指向临时目录，测试不写入仓库的output目录"""
+    output_dir = tmp_path / "output"
+    monkeypatch.setattr(config, "output_dir", output_dir)
+    monkeypatch.setattr(config, "harness_dir", output_dir / "harness")
+    monkeypatch.setattr(config, "exception_dir", output_dir / "exception")
+    monkeypatch.setattr(config, "corpus_dir", output_dir / "corpus")
+    ensure_output_dirs.cache_clear()
+    yield output_dir
+    ensure_output_dirs.cache_clear()
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """持久化缓存目录指向临时目录，测试不写入用户目录下的缓存"""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(config, "cache_dir", cache_dir)
+    return cache_dir
@@ -1,5 +1,6 @@
 """智能体测试"""
 import pytest
+import time
 from pathlib import Path
 import sys
 
@@ -9,6 +10,15 @@ from src.models.code_metadata import CodeMetadata, FunctionInfo, FunctionParam
 from src.models.analysis_result import HarnessResult, CoverageInfo, ErrorType
 from src.agents.repair_agent import RepairAgent
 from src.agents.mutation_agent import MutationAgent
+from src.agents.generation_agent import GenerationAgent
+from src.agents.analysis_agent import AnalysisAgent
+from src.agents.orchestrator import AgentOrchestrator
+from src.agents._extract import extract_code, extractor_for
+
+async def _chunks(*parts):
+    """模拟LLM流式响应"""
+    for p in parts:
+        yield p
 
 class TestRepairAgent:
     """修复智能体测试"""
@@ -36,6 +46,202 @@ class TestRepairAgent:
         error = self.agent.classify_error("segmentation fault")
         assert error.type == ErrorType.MEMORY
 
+    def test_classify_large_error_log(self):
+        """测试大段编译输出的分类耗时为线性"""
+        log = "warning: unused variable of type int\n" * 4000
+        start = time.perf_counter()
+        error = self.agent.classify_error(log)
+        assert time.perf_counter() - start < 1.0
+        assert error.type == ErrorType.RUNTIME
+        error = self.agent.classify_error(log + "note: incompatible pointer")
+        assert error.type == ErrorType.TYPE_MISMATCH
+
+    def test_extract_code_cpp_block(self):
+        """测试```cpp代码块不会残留语言标识"""
+        assert self.agent._extract_code("```cpp\nint x;\n```") == "int x;"
+    
+    @pytest.mark.asyncio
+    async def test_iterative_repair_picks_valid_candidate(self):
+        """测试并发修复候选中选取通过验证的一个"""
+        async def fake_execute(harness, error_info, temperature=0.7):
+            return HarnessResult(harness_code=f"code@{temperature}", target_functions=[])
+        
+        async def validator(code):
+            return code == "code@1.0", "error: expected ';'"
+        
+        self.agent.execute = fake_execute
+        result = await self.agent.iterative_repair(
+            HarnessResult(harness_code="broken", target_functions=[]), validator
+        )
+        
+        assert result.harness_code == "code@1.0"
+        assert result.compile_success
+        assert result.errors[0].type == ErrorType.SYNTAX
+
+class TestExtractCode:
+    """代码块提取测试"""
+    
+    def test_extract_tagged_block(self):
+        """测试带语言标识的代码块"""
+        response = "修复如下:\n```cpp\nint x = 0;\n```\n说明"
+        assert extract_code(response) == "int x = 0;"
+    
+    def test_extract_untagged_block(self):
+        """测试不带语言标识的代码块"""
+        assert extract_code("```\nvoid f(void);\n```") == "void f(void);"
+    
+    def test_extract_without_block(self):
+        """测试没有代码块时返回原文"""
+        assert extract_code("  int y;  ") == "int y;"
+    
+    def test_extractor_prefers_language_block(self):
+        """测试按语言提取时跳过其他语言的代码块"""
+        response = "编译命令:\n```bash\nclang -fsanitize=fuzzer a.cpp\n```\n```cpp\nint x;\n```"
+        assert extractor_for("cpp")(response) == "int x;"
+        assert extractor_for("c")(response) == "clang -fsanitize=fuzzer a.cpp"
+        assert extractor_for("cpp") is extractor_for("cpp")
+
+class TestGenerationAgent:
+    """生成智能体测试"""
+    
+    def setup_method(self):
+        self.agent = GenerationAgent()
+    
+    @pytest.mark.asyncio
+    async def test_extract_code_streaming(self):
+        """测试跨分片的代码块提取"""
+        code = await self.agent._extract_code_streaming(_chunks(
+            "下面是驱动程序:\n`", "``c\nint LLVMFuzzer", "TestOneInput() {}\n`", "``\n多余的解释"
+        ))
+        assert code == "int LLVMFuzzerTestOneInput() {}"
+    
+    def test_prompt_cache_breakpoint_follows_config(self):
+        """测试前缀块的缓存标记受LLM_PROMPT_CACHE控制，off时不发送"""
+        metadata = CodeMetadata(project_name="demo", language="c", functions=[])
+        func = FunctionInfo(name="parse", return_type="int")
+        
+        def prefix_block(prompt_cache):
+            self.agent.llm_config = self.agent.llm_config.model_copy(
+                update={"prompt_cache": prompt_cache}
+            )
+            self.agent._init_request_templates()
+            return self.agent._build_prompt(metadata, [func])[0]
+        
+        assert prefix_block("auto")["cache_control"] == {"type": "ephemeral"}
+        prefix = prefix_block("off")
+        assert "cache_control" not in prefix
+        assert prefix["text"].startswith("请为以下C函数生成")
+    
+    @pytest.mark.asyncio
+    async def test_extract_code_streaming_skips_other_language(self):
+        """测试流式提取跳过其他语言的代码块，与非流式提取结果一致"""
+        response = "编译命令:\n```bash\nclang -fsanitize=fuzzer a.c\n```\n```c\nint x;\n```\n说明"
+        parts = [response[i:i + 5] for i in range(0, len(response), 5)]
+        
+        code = await self.agent._extract_code_streaming(_chunks(*parts), "c")
+        assert code == "int x;" == self.agent._extract_code(response, "c")
+    
+    @pytest.mark.asyncio
+    async def test_extract_code_streaming_crlf_fence(self):
+        """测试围栏行带CRLF或行尾空格时仍识别语言标识并提前结束"""
+        response = "```bash\r\nmake\r\n```\r\n```C \r\nint x;\r\n```"
+        resumed = []
+        
+        async def chunks():
+            yield response
+            resumed.append(True)
+            yield "\r\n后续内容"
+        
+        code = await self.agent._extract_code_streaming(chunks(), "c")
+        assert code == "int x;" == self.agent._extract_code(response, "c")
+        assert resumed == []
+    
+    @pytest.mark.asyncio
+    async def test_extract_code_streaming_falls_back_to_first_block(self):
+        """测试没有目标语言的代码块时退回第一个代码块"""
+        code = await self.agent._extract_code_streaming(_chunks("```\nint y;\n```"), "c")
+        assert code == "int y;"
+    
+    @pytest.mark.asyncio
+    async def test_extract_code_streaming_without_fence(self):
+        """测试没有代码块时返回完整响应"""
+        code = await self.agent._extract_code_streaming(_chunks("int main() ", "{ return 0; }"))
+        assert code == "int main() { return 0; }"
+
+class TestAnalysisAgent:
+    """分析智能体测试"""
+    
+    def setup_method(self):
+        self.agent = AnalysisAgent()
+    
+    def test_parse_fix_report(self):
+        """测试解析结构化修复结果"""
+        response = '{"fixed_code": "int x = 0;", "fixes": ["初始化变量"]}'
+        assert self.agent._parse_fix_report(response) == "int x = 0;"
+    
+    def test_parse_fix_report_fallback(self):
+        """测试非JSON输出时退回代码块提取"""
+        assert self.agent._parse_fix_report("```c\nint x = 0;\n```") == "int x = 0;"
+
+class TestAgentOrchestrator:
+    """协调器测试"""
+    
+    def setup_method(self):
+        self.orchestrator = AgentOrchestrator()
+    
+    def test_parse_vulnerabilities(self):
+        """测试从分析报告中解析漏洞标题、详情和严重程度"""
+        analysis = (
+            "## 发现的问题\n\n"
+            "### 问题1: 缓冲区溢出\n- 严重程度: 高\n- 位置: 第3行\n\n"
+            "  **问题2: 内存泄漏**\n- 严重性：低\n"
+            "### 问题3: 未检查返回值"
+        )
+        
+        vulns = self.orchestrator._parse_vulnerabilities(analysis)
+        
+        assert [v["title"] for v in vulns] == [
+            "### 问题1: 缓冲区溢出", "**问题2: 内存泄漏**", "### 问题3: 未检查返回值"
+        ]
+        assert [v["severity"] for v in vulns] == ["高", "低", "中"]
+        assert vulns[0]["details"] == ["- 严重程度: 高", "- 位置: 第3行", ""]
+        assert vulns[2]["details"] == []
+
+    @pytest.mark.asyncio
+    async def test_failed_analysis_marks_result(self):
+        """测试AI分析失败时结果标记为不成功"""
+        async def failing_analyze(code, language, fix_if=None):
+            return {"success": False, "error": "API请求频率过高"}
+        
+        self.orchestrator._analyze_and_fix = failing_analyze
+        result = await self.orchestrator.analyze_code("int x;", "c")
+        
+        assert result["success"] is False
+        assert "API请求频率过高" in result["security_analysis"]
+
+    def test_generate_suggestions_and_summary(self):
+        """测试严重程度统计和同名函数的指针提示去重"""
+        func = FunctionInfo(
+            name="parse", return_type="int",
+            params=[FunctionParam(name="buf", type="char", is_pointer=True)]
+        )
+        result = {
+            "vulnerabilities": [{"severity": "高"}, {"severity": "中"}, {"severity": "高"}],
+            "fixed_code": "",
+            "code_info": {"functions": [func, func], "line_count": 10, "function_count": 2}
+        }
+        counts = self.orchestrator._count_severities(result["vulnerabilities"])
+        
+        suggestions = self.orchestrator._generate_suggestions(result, counts)
+        summary = self.orchestrator._generate_summary(result, counts)
+        
+        assert suggestions == [
+            "🚨 发现 2 个高危漏洞，建议立即修复",
+            "⚠️ 发现 1 个中危问题，建议尽快处理",
+            "💡 函数 parse 使用指针参数，已添加空指针检查"
+        ]
+        assert "（高危 2 个，中危 1 个）" in summary
+
 class TestMutationAgent:
     """变异智能体测试"""
     
@@ -62,6 +268,28 @@ class TestMutationAgent:
             if len(combo) == 1:
                 assert combo != ["func_a"]
     
+    def test_heuristic_combinations_tracks_new_tests(self):
+        """测试已测试列表追加后增量生效"""
+        tested = [["func_a"]]
+        self.agent._heuristic_combinations(self.metadata, tested)
+        
+        tested.append(["func_b"])
+        combinations = self.agent._heuristic_combinations(self.metadata, tested)
+        
+        singles = [c for c in combinations if len(c) == 1]
+        assert singles == [["func_c"]]
+    
+    def test_heuristic_combinations_with_tested_set(self):
+        """测试引擎传入元组集合时直接用集合判断"""
+        tested = {("func_a",)}
+        self.agent._heuristic_combinations(self.metadata, tested)
+        
+        tested.add(("func_b",))
+        combinations = self.agent._heuristic_combinations(self.metadata, tested)
+        
+        singles = [c for c in combinations if len(c) == 1]
+        assert singles == [["func_c"]]
+    
     def test_update_api_weights(self):
         """测试API权重更新"""
         self.agent.update_api_weights("func_a", 10.0)
@@ -80,6 +308,22 @@ class TestMutationAgent:
         assert priority[0] == "func_a"
         assert priority[1] == "func_c"
     
+    def test_priority_cache_invalidated_by_weights(self):
+        """测试权重更新后优先级缓存失效"""
+        assert self.agent.get_priority_apis(self.metadata, top_k=1) == ["func_a"]
+        
+        self.agent.update_api_weights("func_c", 100.0)
+        assert self.agent.get_priority_apis(self.metadata, top_k=1) == ["func_c"]
+    
+    def test_coverage_percentages_follow_set_covered(self):
+        """测试覆盖率随set_covered更新"""
+        coverage = CoverageInfo(total_lines=200, covered_lines=50)
+        assert coverage.line_coverage == 25
+        
+        coverage.set_covered(100)
+        assert coverage.line_coverage == 50
+        assert coverage.branch_coverage == 0
+    
     def test_calculate_coverage_gain(self):
         """测试覆盖率增益计算"""
         self.agent.coverage_history = [
@@ -89,6 +333,39 @@ class TestMutationAgent:
         
         gain = self.agent._calculate_coverage_gain()
         assert gain == 10.0  # 60% - 50% = 10%
+    
+    def test_suggestion_prompt_lists_recent_combinations(self):
+        """测试提示词按测试顺序列出最近的组合，而不是集合中的任意组合"""
+        recent = [(f"api_{i}",) for i in range(12)]
+        prompt = self.agent._build_suggestion_prompt(
+            self.metadata, CoverageInfo(), set(recent), recent
+        )
+        
+        expected = str([[f"api_{i}"] for i in range(2, 12)])
+        assert f"已测试的API组合:\n{expected}\n" in prompt
+    
+    @pytest.mark.asyncio
+    async def test_llm_suggestions_are_sampled(self):
+        """测试组合建议使用采样调用，不会命中确定性缓存"""
+        temperatures = []
+        
+        async def fake_call_llm(prompt, system_prompt=None, temperature=None):
+            temperatures.append(temperature)
+            return "[]"
+        
+        self.agent.call_llm = fake_call_llm
+        await self.agent._llm_suggest_combinations(self.metadata, CoverageInfo(), set())
+        
+        assert temperatures == [None]
+    
+    @pytest.mark.asyncio
+    async def test_coverage_history_bounded(self):
+        """测试覆盖率历史只保留最近几轮"""
+        for i in range(50):
+            await self.agent.execute(self.metadata, CoverageInfo(covered_lines=i), set())
+        
+        assert len(self.agent.coverage_history) < 50
+        assert self.agent.coverage_history[-1].covered_lines == 49
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
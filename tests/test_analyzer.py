@@ -6,6 +6,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.analyzers.ast_parser import ASTParser
+from src.analyzers.ast_cache import ASTCache
 from src.analyzers.metadata_extractor import MetadataExtractor
 
 class TestASTParser:
@@ -33,6 +34,22 @@ def add(a: int, b: int) -> int:
         assert functions[0].name == "hello"
         assert functions[1].name == "add"
     
+    def test_parse_python_file_bounded_dump(self, tmp_path):
+        """测试Python AST输出有长度上限，且与函数提取共用语法树"""
+        code = "\n".join(f"def func_{i}(x):\n    return x + {i}\n" for i in range(2000))
+        file_path = tmp_path / "big.py"
+        file_path.write_text(code)
+        
+        result = self.parser._parse_python_file(file_path)
+        tree = self.parser._last_py_tree[1]
+        functions = self.parser._extract_python_functions(file_path)
+        
+        assert result["success"]
+        assert "FunctionDef func_0 <line:1>" in result["ast_dump"]
+        assert len(result["ast_dump"]) <= 10000
+        assert self.parser._last_py_tree[1] is tree
+        assert len(functions) == 2000
+    
     def test_extract_c_functions(self, tmp_path):
         """测试C函数提取"""
         code = '''
@@ -54,6 +71,128 @@ void print_message(const char *msg) {
         assert "add" in func_names
         assert "print_message" in func_names
 
+    def test_extract_c_functions_regex(self, tmp_path):
+        """测试正则回退路径的函数过滤与行号"""
+        code = '''
+int add(int a, int b) {
+    if (a) {
+        return a + b;
+    }
+    return b;
+}
+
+void print_message(const char *msg) {
+    printf("%s", msg);
+}
+'''
+        file_path = tmp_path / "test.c"
+        file_path.write_text(code)
+        
+        functions = self.parser._extract_c_functions(file_path)
+        
+        assert [(f.name, f.line_number) for f in functions] == [("add", 2), ("print_message", 9)]
+        assert functions[1].params[0].is_pointer
+
+    def test_extract_functions_and_includes(self, tmp_path):
+        """测试一次读取同时提取函数和include"""
+        code = '''
+#include <stdio.h>
+  # include "myheader.h"
+
+int add(int a, int b) {
+    return a + b;
+}
+'''
+        file_path = tmp_path / "test.c"
+        file_path.write_text(code)
+        
+        functions, includes = self.parser.extract_functions_and_includes(file_path)
+        
+        assert [f.name for f in functions] == ["add"]
+        assert includes == ["stdio.h", "myheader.h"]
+
+    def test_extract_functions_and_includes_stops_after_header(self, tmp_path):
+        """测试include只在文件头部提取，函数体之后的不再扫描"""
+        body = "\n".join(f"int v{i} = {i};" for i in range(100))
+        file_path = tmp_path / "test.c"
+        file_path.write_text(f"#include <stdio.h>\n{body}\n#include <late.h>\n")
+        
+        _, includes = self.parser.extract_functions_and_includes(file_path)
+        
+        assert includes == ["stdio.h"]
+
+    def test_extract_functions_from_source(self):
+        """测试直接从内存源码提取函数"""
+        code = "int add(int a, int b) {\n    return a + b;\n}\n"
+        
+        functions = self.parser.extract_functions_from_source(code, ".c")
+        
+        assert [f.name for f in functions] == ["add"]
+        assert self.parser.extract_functions_from_source("def f(x):\n    pass\n", ".py")[0].name == "f"
+
+class TestASTCache:
+    """AST解析缓存测试"""
+    
+    def setup_method(self):
+        self.parser = ASTParser()
+    
+    def test_roundtrip(self, tmp_path):
+        """测试缓存写入与读取"""
+        cache = ASTCache(tmp_path / "ast.sqlite")
+        key = cache.make_key("c-functions", tmp_path / "a.c", b"int x;")
+        
+        assert cache.get(key) is None
+        cache.set(key, ["add"])
+        assert cache.get(key) == ["add"]
+        assert cache.make_key("c-functions", tmp_path / "a.c", b"int y;") != key
+    
+    def test_evicts_least_recently_accessed(self, tmp_path):
+        """测试条目数超过上限时淘汰最久未访问的条目"""
+        cache = ASTCache(tmp_path / "ast.sqlite", max_entries=10)
+        keys = [cache.make_key("c-functions", tmp_path / f"{i}.c", b"") for i in range(11)]
+        for key in keys[:10]:
+            cache.set(key, [key])
+        cache.get(keys[0])
+        cache.set(keys[10], [keys[10]])
+        
+        assert cache.get(keys[0]) == [keys[0]]
+        assert cache.get(keys[10]) == [keys[10]]
+        assert cache.get(keys[1]) is None
+        assert len(cache) == 9
+    
+    def test_parser_uses_cache(self, tmp_path):
+        """测试内容不变时复用缓存，内容变化后重新解析"""
+        self.parser._cache = ASTCache(tmp_path / "ast.sqlite")
+        self.parser._index = None
+        file_path = tmp_path / "test.c"
+        file_path.write_text("int add(int a, int b) {\n    return a + b;\n}\n")
+        
+        first = self.parser.extract_functions(file_path)
+        calls = []
+        self.parser._extract_c_functions = lambda path: calls.append(path) or []
+        
+        assert self.parser.extract_functions(file_path) == first
+        assert calls == []
+        
+        file_path.write_text("int sub(int a, int b) {\n    return a - b;\n}\n")
+        assert self.parser.extract_functions(file_path) == []
+        assert calls == [file_path]
+    
+    def test_file_and_source_share_cache_kind(self, tmp_path):
+        """测试文件和内存源码的函数提取使用同一缓存类型"""
+        cache = ASTCache(tmp_path / "ast.sqlite")
+        kinds = []
+        make_key = cache.make_key
+        cache.make_key = lambda kind, *args: kinds.append(kind) or make_key(kind, *args)
+        self.parser._cache = cache
+        file_path = tmp_path / "test.c"
+        file_path.write_text("int add(int a, int b) {\n    return a + b;\n}\n")
+        
+        self.parser.extract_functions(file_path)
+        self.parser.extract_functions_from_source(file_path.read_text(), ".c")
+        
+        assert kinds == [f"c-functions:{self.parser._backend}"] * 2
+
 class TestMetadataExtractor:
     """元数据提取器测试"""
     
@@ -78,6 +217,58 @@ int main() { return 0; }
         assert "stdlib.h" in includes
         assert "myheader.h" in includes
     
+    def test_extract_includes_stops_after_header(self, tmp_path):
+        """测试include提取在头部之后提前结束"""
+        body = "\n".join(f"int v{i} = {i};" for i in range(100))
+        code = (
+            "/* header\n * comment\n */\n"
+            "#include <stdio.h>\n"
+            "#ifdef DEBUG\n#  include \"debug.h\"\n#endif\n"
+            f"{body}\n#include <late.h>\n"
+        )
+        file_path = tmp_path / "test.c"
+        file_path.write_text(code)
+        
+        includes = self.extractor._extract_includes(file_path)
+        
+        assert includes == ["stdio.h", "debug.h"]
+    
+    def test_extract_from_project_parallel(self, tmp_path):
+        """测试文件较多时并行扫描，结果与文件顺序一致"""
+        for i in range(10):
+            (tmp_path / f"f{i}.c").write_text(
+                f"#include <h{i}.h>\nint func{i}(int x) {{\n    return x;\n}}\n"
+            )
+        
+        metadata = self.extractor.extract_from_project(tmp_path)
+        expected = [Path(f).stem.replace("f", "func") for f in metadata.source_files]
+        
+        assert [f.name for f in metadata.functions] == expected
+        assert sorted(metadata.includes) == sorted(f"h{i}.h" for i in range(10))
+    
+    def test_collect_source_files(self, tmp_path):
+        """测试按语言扩展名收集源文件，配置目录不存在时搜索整个项目"""
+        (tmp_path / "src" / "sub").mkdir(parents=True)
+        (tmp_path / "src" / "a.cpp").write_text("")
+        (tmp_path / "src" / "sub" / "b.hpp").write_text("")
+        (tmp_path / "src" / "c.py").write_text("")
+        
+        files = self.extractor._collect_source_files(
+            tmp_path, {"language": "cpp", "source_dirs": ["missing"]}
+        )
+        
+        assert [f.name for f in files] == ["a.cpp", "b.hpp"]
+    
+    def test_load_toml_config(self, tmp_path):
+        """测试没有YAML配置时读取TOML配置"""
+        (tmp_path / "fuzz_config.toml").write_text(
+            'name = "toml_project"\nlanguage = "cpp"\nsource_dirs = ["src"]\n'
+        )
+        
+        config = self.extractor._load_config(self.extractor._find_config(tmp_path))
+        
+        assert config == {"name": "toml_project", "language": "cpp", "source_dirs": ["src"]}
+    
     def test_to_prompt_context(self):
         """测试提示词上下文生成"""
         from src.models.code_metadata import CodeMetadata, FunctionInfo, FunctionParam
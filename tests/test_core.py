@@ -0,0 +1,310 @@
+"""核心模块测试"""
+import pytest
+from pathlib import Path
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+from src.core import cleanup
+from src.core.singleflight import SingleFlight
+from src.core.llm_cache import LLMCache, ResponseCache, llm_cache, response_cache
+from src.api import routes
+from src.agents import base_agent
+from src.agents.base_agent import BaseAgent
+
+class CountingAgent(BaseAgent):
+    """记录LLM调用次数的测试智能体"""
+    
+    def __init__(self):
+        super().__init__("CountingAgent")
+        self.llm_config = self.llm_config.model_copy(update={"provider": "openai"})
+        self.calls = 0
+    
+    async def _call_openai(self, messages, system_prompt=None, temperature=0.7,
+                           response_schema=None):
+        self.calls += 1
+        return f"response {self.calls}"
+    
+    async def execute(self, *args, **kwargs):
+        pass
+
+class TestLLMCache:
+    """LLM响应缓存测试"""
+    
+    def setup_method(self):
+        llm_cache.clear()
+    
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = LLMCache(capacity=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        
+        assert cache.get("a") == "1"
+        assert cache.get("b") is None
+        assert len(cache) == 2
+    
+    @pytest.mark.asyncio
+    async def test_deterministic_calls_are_cached(self):
+        """测试temperature=0的调用命中缓存"""
+        agent = CountingAgent()
+        first = await agent.call_llm("prompt", "system", temperature=0)
+        second = await agent.call_llm("prompt", "system", temperature=0)
+        
+        assert first == second
+        assert agent.calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_sampling_calls_bypass_cache(self):
+        """测试非零temperature的调用不走缓存"""
+        agent = CountingAgent()
+        await agent.call_llm("prompt", "system")
+        await agent.call_llm("prompt", "system")
+        
+        assert agent.calls == 2
+    
+    def test_default_temperature_per_provider(self):
+        """测试未指定temperature时OpenAI使用0.7，Anthropic使用服务端默认值"""
+        agent = CountingAgent()
+        messages = [{"role": "user", "content": "x"}]
+        
+        _, _, body = agent._openai_request(messages, "system", None)
+        assert body["temperature"] == 0.7
+        _, _, body = agent._anthropic_request(messages, "system", None)
+        assert "temperature" not in body
+        _, _, body = agent._anthropic_request(messages, "system", 0.2)
+        assert body["temperature"] == 0.2
+
+class TestResponseCache:
+    """API层分析结果缓存测试"""
+    
+    def test_ttl_expiry(self, monkeypatch):
+        """测试条目过期后不再命中"""
+        now = [1000.0]
+        monkeypatch.setattr(time, "time", lambda: now[0])
+        cache = ResponseCache(ttl=60)
+        cache.set("k", {"summary": "ok"})
+        
+        assert cache.get("k") == {"summary": "ok"}
+        now[0] += 61
+        assert cache.get("k") is None
+        assert len(cache) == 0
+    
+    def test_save_and_load(self, tmp_path):
+        """测试结果写入文件后可由新实例恢复"""
+        path = tmp_path / "responses.json"
+        cache = ResponseCache(ttl=60, path=path)
+        cache.set("k", {"vulnerabilities": [1, 2]})
+        cache.save()
+        
+        restored = ResponseCache(ttl=60, path=path)
+        restored.load()
+        assert restored.get("k") == {"vulnerabilities": [1, 2]}
+    
+    def test_disabled_when_ttl_zero(self):
+        """测试ttl为0时不缓存"""
+        cache = ResponseCache(ttl=0)
+        cache.set("k", {})
+        assert cache.get("k") is None
+    
+    @pytest.mark.asyncio
+    async def test_failed_analysis_not_cached(self):
+        """测试分析失败的结果不写入缓存，重试时重新调用"""
+        class FailingOrchestrator:
+            calls = 0
+            
+            async def analyze_code(self, code, language):
+                self.calls += 1
+                return {"success": False, "security_analysis": "分析失败: API请求频率过高"}
+        
+        orchestrator = FailingOrchestrator()
+        request = routes.CodeAnalyzeRequest(code="int failed_analysis_probe;")
+        response_cache.clear()
+        
+        await routes.analyze_security(request, orchestrator)
+        await routes.analyze_security(request, orchestrator)
+        
+        assert orchestrator.calls == 2
+        assert len(response_cache) == 0
+
+class TestTempPool:
+    """代码片段临时文件池测试"""
+    
+    def test_reuse_and_close(self, isolated_output):
+        """测试文件用完后放回池中复用，关闭时删除池目录"""
+        with routes._pooled_temp("int a;", ".c") as first:
+            assert first.read_text() == "int a;"
+        with routes._pooled_temp("int b;", ".c") as second:
+            assert second == first
+            assert second.read_text() == "int b;"
+        assert first.read_bytes() == b""
+        
+        routes.close_temp_pool()
+        assert not (isolated_output / "tmp").exists()
+
+class TestCleanup:
+    """后台清理任务测试"""
+    
+    @pytest.mark.asyncio
+    async def test_schedule_and_drain(self, tmp_path):
+        """测试加入队列的目录在drain后被删除"""
+        dirs = []
+        for i in range(3):
+            d = tmp_path / f"upload_{i}"
+            d.mkdir()
+            (d / "code.c").write_text("int x;")
+            dirs.append(d)
+            cleanup.schedule_removal(d)
+        
+        await cleanup.drain()
+        assert not any(d.exists() for d in dirs)
+
+class TestSingleFlight:
+    """并发请求合并测试"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """测试相同键的并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = 0
+        
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"calls": calls}
+        
+        results = await asyncio.gather(*[flight.do("k", work) for _ in range(5)])
+        
+        assert calls == 1
+        assert all(r is results[0] for r in results)
+        assert len(flight) == 0
+    
+    @pytest.mark.asyncio
+    async def test_error_propagates_and_cancel_isolated(self):
+        """测试异常传给所有等待方，单个等待方取消不影响共享执行"""
+        flight = SingleFlight()
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        results = await asyncio.gather(flight.do("e", fail), flight.do("e", fail),
+                                       return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+        
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+
+class TestPromptCache:
+    """系统提示词前缀缓存配置测试"""
+    
+    def _agent(self, base_url, prompt_cache):
+        agent = CountingAgent()
+        agent.llm_config = agent.llm_config.model_copy(
+            update={"openai_base_url": base_url, "prompt_cache": prompt_cache}
+        )
+        agent._init_request_templates()
+        return agent
+    
+    def _cache_key(self, agent):
+        _, _, body = agent._openai_request([{"role": "user", "content": "x"}], "system", 0)
+        return body.get("prompt_cache_key")
+    
+    def test_auto_only_for_openai(self):
+        """测试auto模式只对OpenAI官方API发送缓存键"""
+        assert self._cache_key(self._agent("https://api.openai.com/v1", "auto"))
+        assert self._cache_key(self._agent("http://localhost:8080/v1", "auto")) is None
+    
+    def test_on_and_off(self):
+        """测试on模式对自建服务也发送缓存键，off模式不发送"""
+        assert self._cache_key(self._agent("http://localhost:8080/v1", "on"))
+        
+        agent = self._agent("https://api.openai.com/v1", "off")
+        assert self._cache_key(agent) is None
+        _, _, body = agent._anthropic_request([], "system", 0)
+        assert "cache_control" not in body["system"][0]
+
+class TestRateLimitRetry:
+    """429限流重试测试"""
+    
+    def setup_method(self):
+        self.statuses = []
+    
+    def _install_client(self, monkeypatch, statuses):
+        """用MockTransport替换共享客户端，按顺序返回给定状态码"""
+        def handler(request):
+            status = statuses.pop(0)
+            self.statuses.append(status)
+            return httpx.Response(status, json={"choices": [{"message": {"content": "ok"}}]})
+        
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(base_agent, "_CLIENT", client)
+        monkeypatch.setattr(base_agent, "_retry_delay", lambda response, attempt: 0)
+    
+    @pytest.mark.asyncio
+    async def test_retry_until_success(self, monkeypatch):
+        """测试429后重试直到成功"""
+        self._install_client(monkeypatch, [429, 429, 200])
+        response = await base_agent._post("https://example.com", {}, {})
+        
+        assert response.status_code == 200
+        assert self.statuses == [429, 429, 200]
+    
+    @pytest.mark.asyncio
+    async def test_retry_exhausted(self, monkeypatch):
+        """测试重试用尽后返回最后一次429响应"""
+        self._install_client(monkeypatch, [429] * 10)
+        response = await base_agent._post("https://example.com", {}, {})
+        
+        assert response.status_code == 429
+        assert len(self.statuses) == base_agent._RATE_LIMIT_RETRIES + 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_retries_rate_limit(self, monkeypatch):
+        """测试流式调用遇到429时同样退避重试"""
+        statuses = [429, 429, 200]
+        
+        def handler(request):
+            status = statuses.pop(0)
+            self.statuses.append(status)
+            if status == 429:
+                return httpx.Response(status)
+            return httpx.Response(status, content=(
+                b'data: {"choices": [{"delta": {"content": "int "}}]}\n\n'
+                b'data: {"choices": [{"delta": {"content": "x;"}}]}\n\n'
+                b'data: [DONE]\n\n'
+            ))
+        
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(base_agent, "_CLIENT", client)
+        monkeypatch.setattr(base_agent, "_retry_delay", lambda response, attempt: 0)
+        
+        agent = CountingAgent()
+        chunks = [c async for c in agent.stream_llm("prompt", "system")]
+        
+        assert "".join(chunks) == "int x;"
+        assert self.statuses == [429, 429, 200]
+    
+    def test_retry_after_header(self):
+        """测试优先使用Retry-After并限制上限"""
+        response = httpx.Response(429, headers={"retry-after": "2"})
+        assert base_agent._retry_delay(response, 0) == 2.0
+        
+        response = httpx.Response(429, headers={"retry-after": "60"})
+        assert base_agent._retry_delay(response, 0) == base_agent._BACKOFF_MAX
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,193 @@
+"""模糊测试模块测试"""
+import asyncio
+import os
+import pytest
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.fuzzer.engine import FuzzEngine
+from src.models.analysis_result import HarnessResult
+from src.fuzzer.validator import (
+    HarnessValidator, _defines_feature_macros, _run_process, cindex, scan_fuzzer_output
+)
+
+class TestHarnessValidator:
+    """驱动程序验证器测试"""
+    
+    def setup_method(self):
+        self.validator = HarnessValidator()
+    
+    def teardown_method(self):
+        self.validator.cleanup()
+    
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(cindex is None, reason="未安装libclang")
+    async def test_validate_syntax_in_process(self):
+        """测试libclang在进程内完成语法检查，不写源文件"""
+        ok, errors = await self.validator.validate_syntax("int add(int a, int b) { return a + b; }")
+        assert ok
+        assert errors == ""
+        
+        ok, errors = await self.validator.validate_syntax("int add(int a, int b { return a + b; }")
+        assert not ok
+        assert "error" in errors
+        assert not any(self.validator.temp_dir.iterdir())
+    
+    @pytest.mark.asyncio
+    async def test_compiled_binary_reused(self, tmp_path, monkeypatch):
+        """测试相同源码只编译一次，之后复用缓存的二进制"""
+        log = tmp_path / "calls.log"
+        compiler = tmp_path / "clang"
+        compiler.write_text(
+            "#!/bin/sh\n"
+            f"echo \"$*\" >> {log}\n"
+            "while [ $# -gt 1 ]; do shift; done\n"
+            "touch \"$1\"\n"
+        )
+        compiler.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        
+        assert await self.validator.validate_compile("int x;") == (True, "")
+        success, _, binary = await self.validator._compile("int x;", "c")
+        
+        assert success
+        assert binary.exists()
+        calls = log.read_text().splitlines()
+        # 一次生成预编译头，一次编译驱动程序
+        assert len(calls) == 2
+        assert "c-header" in calls[0]
+        assert "-include-pch" in calls[1]
+        
+        # 在头文件之前定义功能测试宏的源码不使用预编译头
+        await self.validator._compile("#define _GNU_SOURCE\n#include <string.h>\n", "c")
+        assert "-include-pch" not in log.read_text().splitlines()[-1]
+    
+    @pytest.mark.asyncio
+    async def test_quick_test_reuses_cpp_binary(self, tmp_path, monkeypatch):
+        """测试C++驱动程序验证后，快速测试按同一语言复用编译产物"""
+        log = tmp_path / "calls.log"
+        for name in ("clang", "clang++"):
+            compiler = tmp_path / name
+            compiler.write_text(
+                "#!/bin/sh\n"
+                f"echo \"$0 $*\" >> {log}\n"
+                "while [ $# -gt 1 ]; do shift; done\n"
+                "touch \"$1\"\n"
+            )
+            compiler.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        
+        assert await self.validator.validate_compile("int x;", "cpp") == (True, "")
+        compiles = len(log.read_text().splitlines())
+        await self.validator.run_quick_test("int x;", tmp_path / "corpus", language="cpp")
+        
+        assert len(log.read_text().splitlines()) == compiles
+    
+    def test_defines_feature_macros(self):
+        """测试只识别第一个include之前的功能测试宏"""
+        assert _defines_feature_macros("#define _GNU_SOURCE\n#include <stdio.h>\n")
+        assert _defines_feature_macros("  # define _POSIX_C_SOURCE 200809L\nint x;\n")
+        assert not _defines_feature_macros("#include <stdio.h>\n#define _GNU_SOURCE\n")
+        assert not _defines_feature_macros("#define BUF_SIZE 16\n#include <stdio.h>\n")
+    
+    @pytest.mark.asyncio
+    async def test_validate_syntax_batch_single_invocation(self, tmp_path, monkeypatch):
+        """测试无libclang时批量语法检查只启动一次编译器，并按文件拆分诊断"""
+        log = tmp_path / "calls.log"
+        compiler = tmp_path / "clang"
+        compiler.write_text(
+            "#!/bin/sh\n"
+            f"echo call >> {log}\n"
+            "status=0\n"
+            "for f in \"$@\"; do\n"
+            "  case \"$f\" in *.c) if grep -q bad \"$f\"; then\n"
+            "    echo \"$f:1:5: error: unknown type name 'bad'\" >&2; status=1; fi;;\n"
+            "  esac\n"
+            "done\n"
+            "exit $status\n"
+        )
+        compiler.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        self.validator._index = None
+        
+        results = await self.validator.validate_syntax_batch(["int x;", "bad y;", "", "int z;"])
+        
+        assert [ok for ok, _ in results] == [True, False, False, True]
+        assert "unknown type name" in results[1][1]
+        assert log.read_text().count("call") == 1
+    
+    def test_scan_fuzzer_output(self):
+        """测试单遍扫描同时得到崩溃标志和最大覆盖率"""
+        output = (
+            "#2\tINITED cov: 12 ft: 13 corp: 1/4b\n"
+            "#8\tNEW    cov: 15 ft: 17 corp: 2/9b\n"
+            "==1==ERROR: AddressSanitizer: heap-buffer-overflow\n"
+            "SUMMARY: AddressSanitizer: heap-buffer-overflow\n"
+        )
+        assert scan_fuzzer_output(output) == (True, 15)
+        assert scan_fuzzer_output("#2\tINITED COV: 3 ft: 3\n") == (False, 3)
+        assert scan_fuzzer_output("no errors here") == (False, 0)
+    
+    @pytest.mark.asyncio
+    async def test_run_process(self):
+        """测试异步子进程的输入输出和超时"""
+        returncode, stdout, _ = await _run_process(["cat"], input="hello", timeout=5)
+        assert returncode == 0
+        assert stdout == "hello"
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await _run_process(["sleep", "5"], timeout=0.1)
+
+class TestFuzzEngine:
+    """模糊测试引擎测试"""
+    
+    def setup_method(self):
+        self.engine = FuzzEngine()
+    
+    def teardown_method(self):
+        self.engine.validator.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_save_harness_unique_names(self, isolated_output):
+        """测试同一次运行中保存的驱动程序按序号命名，不会互相覆盖"""
+        harness_dir = isolated_output / "harness"
+        harness = HarnessResult(harness_code="int x;", target_functions=["parse"])
+        
+        await self.engine._save_harness(harness, "success")
+        await self.engine._save_harness(harness, "success")
+        
+        names = sorted(p.name for p in harness_dir.iterdir())
+        assert names == [
+            f"harness_parse_{self.engine._run_id}_000001.c",
+            f"harness_parse_{self.engine._run_id}_000002.c"
+        ]
+        content = (harness_dir / names[0]).read_text()
+        assert content.startswith("// Target functions: ['parse']\n// Status: success\n")
+        assert content.endswith("\n\nint x;")
+    
+    @pytest.mark.asyncio
+    async def test_run_fuzzing_parses_max_coverage(self, monkeypatch):
+        """测试从libFuzzer输出中解析最大覆盖率"""
+        output = (
+            "#2\tINITED cov: 12 ft: 13 corp: 1/4b exec/s: 0 rss: 30Mb\n"
+            "#8\tNEW    cov: 15 ft: 17 corp: 2/9b lim: 4 exec/s: 0 rss: 30Mb\n"
+            "#1024\tpulse  cov: 15 ft: 17 corp: 2/9b lim: 11 exec/s: 512 rss: 31Mb\n"
+            "recov: 99\n"
+        )
+        
+        languages = []
+        
+        async def fake_quick_test(code, corpus_dir=None, language="c"):
+            languages.append(language)
+            return True, output
+        monkeypatch.setattr(self.engine.validator, "run_quick_test", fake_quick_test)
+        
+        harness = HarnessResult(harness_code="int x;", target_functions=["f"])
+        coverage = await self.engine._run_fuzzing(harness, "cpp")
+        assert coverage.covered_lines == 15
+        assert languages == ["cpp"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])